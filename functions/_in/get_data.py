@@ -3,6 +3,8 @@
 """
 
 import numpy as np
+from operator import itemgetter
+from os.path import getmtime, getsize, isfile, splitext
 import get_in_params as g
 
 
@@ -15,20 +17,203 @@ def rem_bad_stars(id_star, x_data, y_data, mag_data, e_mag, col1_data,
     # Set photometric range for accepted stars.
     min_lim, max_lim = -50., 50.
 
-    # Store indexes of stars that should be removed.
-    lists_arr = zip(mag_data, e_mag, col1_data, e_col1)
-    del_indexes = [i for i, t in enumerate(lists_arr) if
-                   any(e > max_lim for e in t) or any(e < min_lim for e in t)]
+    # Flag stars that should be removed.
+    phot = np.array([mag_data, e_mag, col1_data, e_col1])
+    bad = ((phot > max_lim) | (phot < min_lim)).any(axis=0)
 
     # Remove stars from id list first since this are strings.
-    id_clean = np.delete(np.array(id_star), del_indexes)
+    id_clean = np.asarray(id_star)[~bad]
     # Remove stars from the rest of the lists simultaneously.
-    clean_array = np.delete(np.array([x_data, y_data, mag_data, e_mag,
-                            col1_data, e_col1]), del_indexes, axis=1)
+    clean_array = np.array([x_data, y_data, mag_data, e_mag, col1_data,
+                            e_col1])[:, ~bad]
 
     return id_clean, clean_array
 
 
+def to_float(col):
+    '''
+    Convert a column of strings to floats. Values that are not numbers (for
+    example 'INDEF') are converted to 99.999.
+    '''
+    try:
+        return col.astype(float)
+    except ValueError:
+        col_f = np.full(len(col), 99.999)
+        for i, val in enumerate(col):
+            try:
+                col_f[i] = float(val)
+            except ValueError:
+                pass
+        return col_f
+
+
+def read_columns(data_file, cols):
+    '''
+    Read the columns given from the data file in a single pass, as string
+    arrays. Empty lines and comments ('#') are skipped. Only the values in
+    the columns given are kept for each row.
+    '''
+    get_cols, max_col = itemgetter(*cols), max(cols)
+    N_cols, rows = set(), []
+    with open(data_file, mode="r") as f_data:
+        for line in f_data:
+            row = line.partition('#')[0].split()
+            if row:
+                N_cols.add(len(row))
+                if len(row) > max_col:
+                    rows.append(get_cols(row))
+
+    # All rows must have the same number of columns.
+    if len(N_cols) > 1:
+        raise ValueError("Unequal number of columns among rows.")
+    if not rows:
+        raise IndexError("Not enough columns.")
+
+    columns = [np.array(_) for _ in zip(*rows)]
+
+    return columns
+
+
+def fits_columns(data_file, cols):
+    '''
+    Read the columns given from the first table in a FITS file.
+    '''
+    from astropy.io import fits
+    with fits.open(data_file, memmap=True) as hdul:
+        table = [_ for _ in hdul if isinstance(
+            _, (fits.BinTableHDU, fits.TableHDU))][0].data
+        columns = binary_columns([table.field(i) for i in cols])
+
+    return columns
+
+
+def hdf5_columns(data_file, cols):
+    '''
+    Read the columns given from the first dataset in an HDF5 file. The
+    dataset is either a table (one field per column) or a 2D array with one
+    row per star.
+    '''
+    import h5py
+    with h5py.File(data_file, 'r') as f_data:
+        dsets = []
+        f_data.visititems(lambda name, obj: dsets.append(obj) if
+                          isinstance(obj, h5py.Dataset) else None)
+        dset = dsets[0]
+        if dset.dtype.names:
+            columns = [dset[dset.dtype.names[i]] for i in cols]
+        else:
+            columns = [dset[:, i] for i in cols]
+        columns = binary_columns(columns)
+
+    return columns
+
+
+def npy_columns(data_file, cols):
+    '''
+    Read the columns given from a .npy file, holding either a structured
+    array (one field per column) or a 2D array with one row per star. The
+    file is memory-mapped, so only the columns used are read.
+    '''
+    arr = np.load(data_file, mmap_mode='r')
+    if arr.dtype.names:
+        columns = [arr[arr.dtype.names[i]] for i in cols]
+    else:
+        columns = [arr[:, i] for i in cols]
+
+    return binary_columns(columns)
+
+
+def npz_columns(data_file, cols):
+    '''
+    Read the columns given from a .npz file holding one array per column.
+    Arrays stored without a name ('arr_0', 'arr_1', ...) are sorted by their
+    number, otherwise the order they were stored in is used.
+    '''
+    with np.load(data_file) as npz:
+        names = npz.files
+        if all(_.startswith('arr_') and _[4:].isdigit() for _ in names):
+            names = sorted(names, key=lambda _: int(_[4:]))
+        columns = binary_columns([npz[names[i]] for i in cols])
+
+    return columns
+
+
+def binary_columns(columns):
+    '''
+    Return the IDs as strings, and the other columns as floats. Values that
+    are not finite (null values) are converted to 99.999, as non numeric
+    values in text files.
+    '''
+    id_star = np.char.strip(np.asarray(columns[0]).astype(str))
+    data = []
+    for col in columns[1:]:
+        col = np.asarray(col, dtype=float)
+        if not np.isfinite(col).all():
+            col = np.where(np.isfinite(col), col, 99.999)
+        data.append(col)
+
+    return id_star, data
+
+
+# Readers for the binary formats, by file extension, and the package they
+# need (if any).
+bin_formats = {'.fits': [fits_columns, 'astropy'],
+               '.fit': [fits_columns, 'astropy'],
+               '.h5': [hdf5_columns, 'h5py'],
+               '.hdf5': [hdf5_columns, 'h5py'],
+               '.npy': [npy_columns, None],
+               '.npz': [npz_columns, None]}
+
+
+def format_available(data_file):
+    '''
+    Check if the package needed to read the data file (given its extension)
+    is installed. Text files need no extra package.
+    '''
+    ext = splitext(data_file)[1].lower()
+    if ext in bin_formats and bin_formats[ext][1] is not None:
+        try:
+            __import__(bin_formats[ext][1])
+        except ImportError:
+            return False
+
+    return True
+
+
+def load_columns(data_file, cols):
+    '''
+    Return the IDs (as strings) and the other columns given (as floats) from
+    the data file.
+
+    Binary files (FITS, HDF5, .npy, .npz) are read with the reader for their
+    extension. For text files, a binary copy of these columns is stored next
+    to the data file the first time it is read, and used in later runs while
+    the data file and the columns selected do not change.
+    '''
+    ext = splitext(data_file)[1].lower()
+    if ext in bin_formats:
+        return bin_formats[ext][0](data_file, cols)
+
+    cache_file = data_file + '_cache.npz'
+    key = np.array([getmtime(data_file), getsize(data_file)] + list(cols))
+
+    if isfile(cache_file):
+        with np.load(cache_file) as cache:
+            if np.array_equal(cache['key'], key):
+                return cache['id_star'], cache['data']
+
+    columns = read_columns(data_file, cols)
+    id_star = columns[0]
+    data = np.array([to_float(_) for _ in columns[1:]])
+
+    try:
+        np.savez(cache_file, key=key, id_star=id_star, data=data)
+    except IOError:
+        print "  WARNING: could not store a binary copy of the data file."
+
+    return id_star, data
+
+
 def get_data(data_file):
     '''
     Get spatial and photometric data from the cluster's data file.
@@ -37,33 +222,25 @@ def get_data(data_file):
     # Read indexes from input params.
     id_inx, x_inx, y_inx, m_inx, em_inx, c_inx, ec_inx = g.gd_params[:-1]
 
-    # Loads the data in 'data_file' as a list of N lists where N is the number
-    # of columns. Each of the N lists contains all the data for the column.
-    # If any string is found (for example 'INDEF') it is converted to 99.999.
+    # Loads only the needed columns in 'data_file'. IDs are kept as strings
+    # so numeric IDs are not converted into floats. I.e.: 190 --> 190.0
+    # If any string is found in the other columns (for example 'INDEF') it is
+    # converted to 99.999.
     try:
-        data = np.genfromtxt(data_file, dtype=float, filling_values=99.999,
-                             unpack=True)
+        id_star, data = load_columns(
+            data_file, [id_inx, x_inx, y_inx, m_inx, em_inx, c_inx, ec_inx])
     except ValueError:
         print ("\n  ERROR: the number of columns is likely unequal\n"
                "  among rows. Check the input data file.")
         raise ValueError("ERROR: Data input file is badly formatted.")
-
-    try:
-        # Read data columns, except IDs.
-        x_data, y_data, mag_data, e_mag, col1_data, e_col1 = \
-            data[x_inx], data[y_inx], data[m_inx], data[em_inx], data[c_inx],\
-            data[ec_inx]
-
-        # Now read IDs as strings. Do this separately so numeric IDs are not
-        # converted into floats by np.genfromtxt. I.e.: 190 --> 190.0
-        data = np.genfromtxt(data_file, dtype=str, unpack=True)
-        id_star = data[id_inx]
-        n_old = len(id_star)
     except IndexError:
         print ("\n  ERROR: data input file contains fewer columns than\n"
                "  those given in 'params_input.dat'.")
         raise IndexError("ERROR: Data input file is badly formatted.")
 
+    x_data, y_data, mag_data, e_mag, col1_data, e_col1 = data
+    n_old = len(id_star)
+
     # If any mag or color value (or their errors) is too large, discard
     # that star.
     id_star, [x_data, y_data, mag_data, e_mag, col1_data, e_col1] = \
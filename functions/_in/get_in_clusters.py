@@ -8,6 +8,7 @@ Created on Fri Apr 04 2014
 from os.path import join
 from os import walk
 import re
+from get_data import format_available
 
 
 def in_clusters(mypath, file_end):
@@ -36,9 +37,16 @@ def in_clusters(mypath, file_end):
                 subdir = subdir0[1:]
             else:
                 subdir = subdir0
-            # Don't attempt to read membership or .md files.
-            if not f.endswith(('_memb.dat', '.md')):
-                cl_files.append([mypath, input_dir, subdir, f])
+            # Don't attempt to read membership, .md or cached data files.
+            if not f.endswith(('_memb.dat', '.md', '_cache.npz')):
+                # Skip binary files if the package needed to read them is
+                # not installed.
+                if format_available(f):
+                    cl_files.append([mypath, input_dir, subdir, f])
+                else:
+                    print ("  WARNING: the package needed to read the file\n"
+                           "  '{}' is not installed. File skipped.".format(
+                               join(subdir, f)))
 
     # Return sorted list by cluster file name.
     cl_files.sort(key=lambda x: x[-1].lower())
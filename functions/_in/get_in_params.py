@@ -41,7 +41,9 @@ def init(mypath, pars_f_path):
     global up_flag, mode, done_dir, gd_params, gh_params, cr_params, kp_flag,\
         im_flag, er_params, fr_number, pv_params, da_params, ps_params, \
         bf_params, sc_params, ga_params, rm_params, pl_params, \
-        flag_move_file, axes_params, flag_back_force
+        flag_move_file, axes_params, flag_back_force, pp_params, mc_params, \
+        go_params, gi_params, bs_params, so_params, mm_params, \
+        gc_params, il_params, ic_params
 
     # Accept these variations of the 'true' flag.
     true_lst = ('True', 'true', 'TRUE')
@@ -121,13 +123,25 @@ def init(mypath, pars_f_path):
                     lkl_method = str(reader[3])
                     bin_method = str(reader[4])
                     N_b = int(reader[5])
+                elif reader[0] == 'PP':
+                    try:
+                        n_proc = int(reader[1])
+                    except:
+                        n_proc = str(reader[1])
                 elif reader[0] == 'PS':
                     iso_select = str(reader[1])
+                    isoch_dtype = str(reader[2])
+                elif reader[0] == 'IL':
+                    il_params = [True if reader[1] in true_lst else False,
+                                 int(reader[2])]
+                elif reader[0] == 'IC':
+                    ic_params = [int(reader[1]), int(reader[2])]
 
                 # Synthetic cluster parameters.
                 elif reader[0] == 'SC':
                     IMF_name = str(reader[1])
                     m_high = float(reader[2])
+                    N_mode = str(reader[3])
                 elif reader[0] == 'PS_m':
                     m_rs = char_remove(reader)
                 elif reader[0] == 'PS_a':
@@ -143,6 +157,9 @@ def init(mypath, pars_f_path):
                     # Use [1:] since the mass ratio is located before the
                     # range.
                     bin_rs = char_remove(reader[1:])
+                elif reader[0] == 'BQ':
+                    q_dist = str(reader[1])
+                    q_gamma = float(reader[2])
 
                 # Genetic algorithm parameters.
                 elif reader[0] == 'GA':
@@ -155,6 +172,25 @@ def init(mypath, pars_f_path):
                     n_el = int(reader[7])
                     n_ei = int(reader[8])
                     n_es = int(reader[9])
+                elif reader[0] == 'MC':
+                    mc_params = [str(reader[1]), int(reader[2])]
+                elif reader[0] == 'GO':
+                    go_params = [str(reader[1]), str(reader[2]),
+                                 int(reader[3])]
+                elif reader[0] == 'GC':
+                    gc_params = [True if reader[1] in true_lst else False,
+                                 int(reader[2]), float(reader[3]),
+                                 float(reader[4])]
+                elif reader[0] == 'GI':
+                    gi_params = [int(reader[1]), int(reader[2])]
+                elif reader[0] == 'SO':
+                    so_params = map(int, reader[1:4])
+                elif reader[0] == 'MM':
+                    mm_params = map(int, reader[1:4]) + [float(reader[4])]
+                elif reader[0] == 'BS':
+                    bs_params = [True if reader[1] in true_lst else False,
+                                 int(reader[2]), int(reader[3]),
+                                 int(reader[4])]
 
                 else:
                     # Get parameters file name from path.
@@ -203,10 +239,11 @@ def init(mypath, pars_f_path):
 
     # Store photometric system params in lists.
     par_ranges = [m_rs, a_rs, e_rs, d_rs, mass_rs, bin_rs]
-    ps_params = [iso_path, cmd_select, iso_select, par_ranges]
+    ps_params = [iso_path, cmd_select, iso_select, isoch_dtype, par_ranges]
 
     # Store GA params in lists.
     bf_params = [bf_flag, best_fit_algor, lkl_method, bin_method, N_b]
-    sc_params = [IMF_name, m_high, bin_mr]
+    pp_params = [n_proc]
+    sc_params = [IMF_name, m_high, bin_mr, N_mode, q_dist, q_gamma]
     ga_params = [n_pop, n_gen, fdif, p_cross, cr_sel, p_mut, n_el, n_ei, n_es]
     rm_params = [mode_red_memb, local_bin, min_prob]
@@ -6,16 +6,23 @@ Created on Thu Jan  9 15:08:39 2014
 """
 
 import numpy as np
+import tempfile
 from .._in import get_in_params as g
 from get_isochs import get_isochs as gi
+from get_isochs import read_isoch, isoch_index
+from ..best_fit import models_cache as m_c
 from get_met_ages_values import get_m_a_vls as gmav
 
 
+# Number of points in each interpolated isochrone.
+N_interp = 1500
+
+
 def interp_isoch(isochrone):
     '''
     Interpolate extra color, magnitude and masses into the isochrone.
     '''
-    N = 1500
+    N = N_interp
     t, xp = np.linspace(0, 1, N), np.linspace(0, 1, len(isochrone[0]))
     # Store isochrone's interpolated values.
     isoch_inter = np.asarray([np.interp(t, xp, _) for _ in isochrone])
@@ -23,6 +30,107 @@ def interp_isoch(isochrone):
     return isoch_inter
 
 
+def isoch_grid(met_f_filter, age_values):
+    '''
+    Contiguous array with the interpolated isochrones for all the metallicity
+    and age values, of shape (n_met, n_age, 3, N_interp).
+
+    The array is memory-mapped to a temporary file (removed when it is
+    closed), so it does not live in the memory of the process and its pages
+    are shared with the processes that evaluate the models.
+    '''
+    # Get isochrones and their parameter values.
+    isoch_list = gi(met_f_filter, age_values)
+
+    # Each metallicity file must contain an isochrone for every age, else
+    # the isochrones would be assigned to the wrong ages.
+    for met_f, metal_isoch in zip(*[met_f_filter, isoch_list]):
+        if len(metal_isoch) != len(age_values):
+            print ("\n  ERROR: {} of the {} age values selected were found\n"
+                   "  in the metallicity file:\n  {}").format(
+                len(metal_isoch), len(age_values), met_f)
+            raise ValueError("ERROR: missing isochrones in metallicity "
+                             "file.")
+
+    # Interpolate extra points into all isochrones.
+    grid = np.memmap(tempfile.TemporaryFile(), dtype=g.ps_params[3],
+                     mode='w+', shape=(len(isoch_list), len(age_values), 3,
+                                       N_interp))
+    for i, metal_isoch in enumerate(isoch_list):
+        for j, isoch in enumerate(metal_isoch):
+            grid[i, j] = interp_isoch(isoch)
+    grid.flush()
+    # The isochrones must not be modified.
+    grid.flags.writeable = False
+
+    return grid
+
+
+def isoch_indexes(param_values):
+    '''
+    Dictionaries that map each metallicity and age value to its index in the
+    grid of isochrones.
+    '''
+    return [dict((p, j) for j, p in enumerate(p_v)) for p_v in
+            param_values[:2]]
+
+
+def missing_isoch(met_f, age):
+    '''
+    Report an age value with no isochrone in a metallicity file.
+    '''
+    print ("\n  ERROR: no isochrone found for the log(age) value {}\n"
+           "  in the metallicity file:\n  {}").format(age, met_f)
+    raise ValueError("ERROR: missing isochrones in metallicity file.")
+
+
+def lazy_isochs(met_f_filter, age_values):
+    '''
+    Provider of isochrones loaded on demand, used instead of the grid of
+    isochrones when the lazy loading is selected. Holds the metallicity
+    files and ages, and a cache for the isochrones already interpolated.
+
+    The files are indexed here (without parsing any isochrone), to check
+    that each one contains an isochrone for every age.
+    '''
+    for met_f in met_f_filter:
+        ages = set(_[0] for _ in isoch_index(met_f))
+        for age in age_values:
+            if age not in ages:
+                missing_isoch(met_f, age)
+
+    isochs = {'met_files': met_f_filter, 'age_values': age_values,
+              'cache': m_c.new_cache(g.il_params[1])}
+
+    return isochs
+
+
+def get_isoch(isochs, m_i, a_i):
+    '''
+    Isochrone for the metallicity and age indexes given, taken from the grid
+    of isochrones or from the provider of lazy loaded isochrones. In the
+    latter case the isochrone is read and interpolated the first time it is
+    requested, and kept in the cache (which drops the least recently used
+    isochrones if its size is limited).
+    '''
+    if not isinstance(isochs, dict):
+        return isochs[m_i][a_i]
+
+    entry = m_c.cache_get(isochs['cache'], (m_i, a_i))
+    if entry is None:
+        met_f, age = isochs['met_files'][m_i], isochs['age_values'][a_i]
+        isoch = read_isoch(met_f, age)
+        # The isochrone holds no data.
+        if isoch is None:
+            missing_isoch(met_f, age)
+        isoch = interp_isoch(isoch).astype(g.ps_params[3])
+        m_c.cache_store(isochs['cache'], (m_i, a_i), isoch)
+    else:
+        isoch = entry[0]
+
+    return isoch
+
+
 def ip():
     '''
     Read isochrones and parameters if best fit function is set to run.
@@ -42,14 +150,12 @@ def ip():
         # METALLICITY FILES*
         param_ranges, met_f_filter, met_values, age_values = gmav(iso_path)
 
-        # Get isochrones and their parameter values.
-        isoch_list = gi(met_f_filter, age_values)
-
-        # Interpolate extra points into all isochrones.
-        isochs_interp = [[] for _ in isoch_list]
-        for i, _ in enumerate(isoch_list):
-            for isoch in _:
-                isochs_interp[i].append(interp_isoch(isoch))
+        # Get the interpolated isochrones for all the metallicity and age
+        # values, or the provider that loads them when they are needed.
+        if g.il_params[0]:
+            isochs_interp = lazy_isochs(met_f_filter, age_values)
+        else:
+            isochs_interp = isoch_grid(met_f_filter, age_values)
 
         # Pack params.
         param_values = [met_values, age_values] + param_ranges[2:]
@@ -61,13 +167,15 @@ def ip():
         lens = [len(_) for _ in param_values]
         total = reduce(lambda x, y: x * y, lens, 1)
         print (
-            "interpolated and stored:\n"
+            "{}:\n"
             "  {} metallicity values (z),\n"
             "  {} age values (per z),\n"
             "  {} reddening values,\n"
             "  {} distance values,\n"
             "  {} mass values,\n"
-            "  {} binary fraction values.".format(*lens))
+            "  {} binary fraction values.".format(
+                'indexed (loaded when needed)' if g.il_params[0] else
+                'interpolated and stored', *lens))
         print "  = {:.1e} approx total models.\n".format(total)
 
     return ip_list
@@ -11,82 +11,107 @@ from .._in import get_in_params as g
 from girardi_isochs_format import isoch_format as i_format
 
 
-def read_met_file(met_f, age_values):
+# Index of the isochrones stored in each metallicity file, so each file is
+# scanned only once.
+isoch_indexes = {}
+
+
+def isoch_index(met_f):
     '''
-    Read a given metallicity file and return the isochrones for the ages
-    within the age range.
+    Scan a metallicity file once and return the log10 of the age of each
+    isochrone stored in it, along with the byte range of its data lines (ie:
+    after its header lines).
+    '''
+    if met_f not in isoch_indexes:
+
+        # Read line start format for the selected set of Girardi isochrones.
+        line_start, age_format = i_format()[:2]
+        # Header line of each isochrone and the comment lines that follow.
+        header = re.compile(re.escape(line_start) + r'[^\n]*?' + age_format +
+                            r'[^\n]*\n(?:#[^\n]*\n)*')
+
+        with open(met_f, mode="rb") as f_iso:
+            data = f_iso.read()
+        matches = list(header.finditer(data))
+
+        index = []
+        for i, match in enumerate(matches):
+            age = np.around(np.log10(float(match.group(1))), 2)
+            # The data of this isochrone ends where the next one begins.
+            i1 = matches[i + 1].start() if i + 1 < len(matches) else \
+                len(data)
+            index.append([age, match.end(), i1])
+        isoch_indexes[met_f] = index
+
+    return isoch_indexes[met_f]
+
+
+def parse_isoch(f_iso, i0, i1):
+    '''
+    Parse the data lines of an isochrone, located in the byte range given of
+    an open metallicity file. Returns its colors, magnitudes and masses, or
+    None if the isochrone holds no data.
     '''
 
     cmd_select = g.ps_params[1]
 
-    # Read line start format and columns indexes for the selected set of
-    # Girardi isochrones.
-    line_start, age_format, imass_idx, mag1_idx, mag2_idx = i_format()
+    # Read columns indexes for the selected set of Girardi isochrones.
+    imass_idx, mag1_idx, mag2_idx = i_format()[2:]
+
+    f_iso.seek(i0)
+    block = f_iso.read(i1 - i0)
+    if not block.strip():
+        return None
+    N_cols = len(block[:block.find('\n')].split())
+    isoch = np.fromstring(block, sep=' ').reshape(-1, N_cols)
+
+    # Color.
+    # Generate colors correctly <-- HARDCODED, FIX
+    if cmd_select in {2, 5, 9, 13}:
+        isoch_col = isoch[:, mag1_idx] - isoch[:, mag2_idx]
+    else:
+        isoch_col = isoch[:, mag2_idx] - isoch[:, mag1_idx]
+
+    return [isoch_col, isoch[:, mag1_idx], isoch[:, imass_idx]]
+
+
+def read_met_file(met_f, age_values):
+    '''
+    Read a given metallicity file and return the isochrones for the ages
+    within the age range. Only the data lines of those isochrones are parsed.
+    '''
 
     # Initialize list that will hold all the isochrones for this
     # metallicity value.
     metal_isoch = []
 
-    # Open the metallicity file.
-    with open(met_f, mode="r") as f_iso:
-
-        # Define empty lists.
-        isoch_col, isoch_mag, isoch_mas = [], [], []
-
-        # Initial value for age to avoid 'not defined' error.
-        age = -99.
-
-        # Iterate through each line in the file.
-        for line in f_iso:
-
-            # Identify beginning of a defined isochrone.
-            if line.startswith(line_start):
-
-                # Save stored values if these exist.
-                # Skip first age for which the lists will be empty.
-                if isoch_col:
-                    # Store color, magnitudes and masses for this
-                    # isochrone.
-                    metal_isoch.append([isoch_col, isoch_mag,
-                                        isoch_mas])
-                    # Reset lists.
-                    isoch_col, isoch_mag, isoch_mas = [], [], []
-
-                # Read age value for this isochrone.
-                age0 = re.findall(age_format, line)  # Find age in line.
-                age = np.around(np.log10(float(age0[0])), 2)
-
-            # If age value falls inside the given range, store the
-            # isochrone's data.
-            if age in age_values:
-
-                # Save mag, color and mass values for each isochrone.
-                if not line.startswith("#"):
-                    reader = line.split()
-                    # Color.
-                    # Generate colors correctly <-- HARDCODED, FIX
-                    if cmd_select in {2, 5, 9, 13}:
-                        isoch_col.append(float(reader[mag1_idx]) -
-                                         float(reader[mag2_idx]))
-                    else:
-                        isoch_col.append(float(reader[mag2_idx]) -
-                                         float(reader[mag1_idx]))
-                    # Magnitude.
-                    isoch_mag.append(float(reader[mag1_idx]))
-                    # Mass
-                    isoch_mas.append(float(reader[imass_idx]))
-
-        # Save the last isochrone when EOF is reached.
-        else:
-            # If list is not empty.
-            if isoch_col:
-                # Store colors, magnitudes and masses for this
-                # isochrone.
-                metal_isoch.append([isoch_col, isoch_mag, isoch_mas])
+    age_values = set(age_values)
+    with open(met_f, mode="rb") as f_iso:
+        for age, i0, i1 in isoch_index(met_f):
+
+            # Skip isochrones with ages outside the given range.
+            if age not in age_values:
+                continue
+
+            isoch = parse_isoch(f_iso, i0, i1)
+            # Skip isochrones with no data.
+            if isoch is not None:
+                # Store color, magnitudes and masses for this isochrone.
+                metal_isoch.append(isoch)
 
     return metal_isoch
 
 
+def read_isoch(met_f, age):
+    '''
+    Read the isochrone for a single age value from a metallicity file.
+    '''
+    with open(met_f, mode="rb") as f_iso:
+        for age_i, i0, i1 in isoch_index(met_f):
+            if age_i == age:
+                return parse_isoch(f_iso, i0, i1)
+
+
 def get_isochs(met_f_filter, age_values):
     '''
     Stores the available isochrones of different metallicities and
@@ -7,10 +7,9 @@ Created on Fri Dec 5 12:00:00 2014
 
 import numpy as np
 import os
-import re
 from os.path import join
 from .._in import get_in_params as g
-from girardi_isochs_format import isoch_format as i_format
+from get_isochs import isoch_index
 
 
 def match_ranges(met_vals_all, met_files, age_vals_all, z_range, a_range):
@@ -79,16 +78,9 @@ def get_ages(met_file):
     '''
     Read all available ages in metallicity file.
     '''
-
-    age_format = i_format()[1]
-
-    # Open the metallicity file.
-    with open(met_file, mode="r") as f_iso:
-        regex = age_format  # Define regular expression.
-        ages0 = re.findall(regex, f_iso.read())  # Find all instances.
-        ages1 = np.asarray(map(float, ages0))  # Map to floats.
-        ages2 = np.log10(ages1)  # Take log10
-        isoch_a = np.around(ages2, 2)  # Round to 2 decimals.
+    # The index of the file is kept, so the file is not scanned again when
+    # its isochrones are read.
+    isoch_a = np.asarray([_[0] for _ in isoch_index(met_file)])
 
     return isoch_a
 
@@ -6,10 +6,15 @@ Created on Wed Feb 12 16:10:05 2014
 """
 
 import numpy as np
+from os.path import join
 from .._in import get_in_params as g
+from .._in.get_isoch_params import isoch_indexes, get_isoch
 from obs_clust_prepare import prepare as prep
 from genetic_algorithm import gen_algor as g_a
 from brute_force_algorithm import brute_force as b_f
+from surrogate_opt import surrog_opt as s_o
+from mcmc_sampler import mcmc as m_s
+import parallel_eval as p_e
 from bootstrap_func import bootstrap
 from synth_cluster import synth_clust as s_c
 from ..errors.error_round import round_sig_fig as rsf
@@ -30,13 +35,15 @@ def synth_cl_plot(ip_list, isoch_fit_params, err_lst, completeness,
     # to some difference in the significant figures, use the indices
     # [0, 0] to prevent the code from halting.
     try:
-        m_i, a_i = param_values[0].index(m), param_values[1].index(a)
+        m_indx, a_indx = isoch_indexes(param_values)
+        m_i, a_i = m_indx[m], a_indx[a]
     except:
         m_i, a_i = [0, 0]
+    isochrone = get_isoch(isoch_list, m_i, a_i)
     # Generate shifted best fit isochrone.
-    shift_isoch = move_isoch(isoch_list[m_i][a_i][:2], e, d)
+    shift_isoch = move_isoch(isochrone[:2], e, d)
     # Generate best fit synthetic cluster.
-    synth_clst = s_c(err_lst, completeness, st_dist_mass, isoch_list[m_i][a_i],
+    synth_clst = s_c(err_lst, completeness, st_dist_mass, isochrone,
                      [-1., -1., e, d, mass, binar_f])
 
     return shift_isoch, synth_clst
@@ -65,21 +72,35 @@ def params_errors(ip_list, err_lst, memb_prob_avrg_sort, completeness,
             else:
                 isoch_fit_errors.append(-1.)
 
-    elif best_fit_algor == 'genet':
+    elif best_fit_algor in {'genet', 'surrog'}:
         if N_b >= 2:
             # Call bootstrap function with resampling to get the uncertainty
             # in each parameter.
             isoch_fit_errors = bootstrap(err_lst, memb_prob_avrg_sort,
-                                         completeness, ip_list, st_dist_mass)
+                                         completeness, ip_list, st_dist_mass,
+                                         isoch_fit_params)
         else:
             print 'Skipping bootstrap process.'
             # No error assignment.
             isoch_fit_errors = [-1.] * len(isoch_fit_params[0])
 
+    elif best_fit_algor == 'mcmc':
+        isoch_fit_errors = []
+        # Assign errors as the standard deviation of the samples of the
+        # chain, with the largest step in each parameter as a lower limit.
+        samples = np.array(isoch_fit_params[-1][0])
+        for i, pv in enumerate(ip_list[1]):
+            if len(pv) > 1:
+                isoch_fit_errors.append(max(np.std(samples[:, i]),
+                                            np.diff(pv).max()))
+            else:
+                isoch_fit_errors.append(-1.)
+
     return isoch_fit_errors
 
 
-def best_fit(err_lst, memb_prob_avrg_sort, completeness, ip_list):
+def best_fit(clust_name, output_subdir, err_lst, memb_prob_avrg_sort,
+             completeness, ip_list):
     '''
     Perform a best fitting process to find the cluster's parameters:
     E(B-V), distance (distance modulus), age and metallicity.
@@ -105,16 +126,18 @@ def best_fit(err_lst, memb_prob_avrg_sort, completeness, ip_list):
         if best_fit_algor == 'brute':
 
             print 'Using Brute Force algorithm ({}).'.format(
-                lkl_method + '; ' + bin_method if lkl_method == 'dolphin'
+                lkl_method + '; ' + bin_method if lkl_method != 'tolstoy'
                 else lkl_method)
-            # Brute force algorithm.
+            # Brute force algorithm. The likelihoods for all the models are
+            # stored in a file in the output folder.
+            bf_file = join(output_subdir, clust_name)
             isoch_fit_params = b_f(err_lst, obs_clust, completeness, ip_list,
-                                   st_dist_mass)
+                                   st_dist_mass, bf_file)
 
         elif best_fit_algor == 'genet':
 
             print 'Using Genetic Algorithm ({}).'.format(
-                lkl_method + '; ' + bin_method if lkl_method == 'dolphin'
+                lkl_method + '; ' + bin_method if lkl_method != 'tolstoy'
                 else lkl_method)
             # Genetic algorithm.
             # Let the GA algor know this call comes from the main function
@@ -123,7 +146,35 @@ def best_fit(err_lst, memb_prob_avrg_sort, completeness, ip_list):
             isoch_fit_params = g_a(flag_print_perc, err_lst, obs_clust,
                                    completeness, ip_list, st_dist_mass)
 
+        elif best_fit_algor == 'surrog':
+
+            print 'Using Surrogate model optimizer ({}).'.format(
+                lkl_method + '; ' + bin_method if lkl_method != 'tolstoy'
+                else lkl_method)
+            flag_print_perc = True
+            isoch_fit_params = s_o(flag_print_perc, err_lst, obs_clust,
+                                   completeness, ip_list, st_dist_mass)
+
+        elif best_fit_algor == 'mcmc':
+
+            print 'Using ensemble MCMC sampler ({}).'.format(
+                lkl_method + '; ' + bin_method if lkl_method != 'tolstoy'
+                else lkl_method)
+            # The chain is stored in a file in the output folder.
+            flag_print_perc = True
+            bf_file = join(output_subdir, clust_name)
+            isoch_fit_params = m_s(flag_print_perc, err_lst, obs_clust,
+                                   completeness, ip_list, st_dist_mass,
+                                   bf_file)
+
         print ("Best fit parameters obtained.")
+        if g.il_params[0] and p_e.num_proc() == 1:
+            # Statistics for the lazy loaded isochrones. Not shown if more
+            # than one process was used, since each one has its own cache.
+            cache = ip_list[0]['cache']
+            print (" Isochrones cache: {} hits, {} misses ({} isochrones "
+                   "stored).".format(cache['hits'], cache['misses'],
+                                     len(cache['models'])))
 
         # Assign errors for each parameter.
         isoch_fit_errors = params_errors(ip_list, err_lst, memb_prob_avrg_sort,
@@ -7,61 +7,171 @@ Created on Fri Mar 07 10:50:05 2014
 
 import numpy as np
 import random
+from collections import OrderedDict
+from multiprocessing import Pool
 from .._in import get_in_params as g
 from genetic_algorithm import gen_algor as g_a
+from surrogate_opt import surrog_opt as s_o
 from obs_clust_prepare import prepare as prep
+import parallel_eval as p_e
 
 
-def resample_replacement(obs_clust):
+# Data needed by each bootstrap run. It is set once per process, so only
+# the seed of each run is sent to the workers.
+shared = {}
+
+
+def init_data(err_lst, obs_arr, completeness, ip_list, st_dist_mass,
+              ga_params, init_pop, worker=False):
+    '''
+    Store the data that does not change between bootstrap runs. Used as the
+    initializer of each worker process.
+    '''
+    shared['err_lst'], shared['obs_arr'] = err_lst, obs_arr
+    shared['completeness'], shared['ip_list'] = completeness, ip_list
+    shared['st_dist_mass'] = st_dist_mass
+    shared['ga_params'], shared['init_pop'] = ga_params, init_pop
+    if worker:
+        # Each worker runs its GA serially, since the processes are already
+        # used by the bootstrap runs.
+        g.pp_params = [1]
+
+
+def top_models(model_done, N):
+    '''
+    Return the N distinct models with the smallest likelihoods.
+    '''
+    models = OrderedDict.fromkeys(
+        model for lkl, model in sorted(zip(*model_done[::-1])))
+
+    return models.keys()[:N]
+
+
+def boot_ga_params(isoch_fit_params):
+    '''
+    GA parameters and initial population used by the bootstrap runs. If the
+    runs are warm started, the best models found by the main fit are used as
+    the initial population and the number of generations, and those that
+    trigger the Extinction/Immigration and exit switch operators, are
+    replaced by the ones selected for the bootstrap.
+    '''
+    ga_params, init_pop = list(g.ga_params), []
+    warm, n_gen, n_ei, n_es = g.bs_params
+    if warm and g.bf_params[1] == 'genet':
+        ga_params[1], ga_params[7], ga_params[8] = n_gen, n_ei, n_es
+        # Solutions and likelihoods of all the models evaluated.
+        model_done = isoch_fit_params[-1]
+        init_pop = top_models(model_done, ga_params[0] + ga_params[0] % 2)
+
+    return ga_params, init_pop
+
+
+def resample_replacement(obs_arr):
     '''
     Resamples the observed cluster with replacement. Used by the bootstrap
     process.
     '''
-    obs_cl = np.array([random.choice(obs_clust) for _ in obs_clust],
-                      dtype=float)
+    obs_cl = obs_arr[np.random.randint(0, len(obs_arr), len(obs_arr))]
 
     return obs_cl
 
 
+def boot_run(i_seed):
+    '''
+    Single bootstrap run: resample the observed cluster and obtain its best
+    fit parameters, with the random generators seeded with the value given.
+    '''
+    i, seed = i_seed
+    np.random.seed(seed)
+    random.seed(seed)
+
+    # Resample cluster with replacement.
+    obs_cl_r = resample_replacement(shared['obs_arr'])
+    # Obtain prepared observed cluster according to the likelihood method
+    # selected.
+    obs_cl = prep(obs_cl_r)
+
+    # Let the algorithm know this call comes from the bootstrap process so it
+    # will not print percentages to screen.
+    flag_print_perc = False
+    if g.bf_params[1] == 'genet':
+        params = g_a(flag_print_perc, shared['err_lst'], obs_cl,
+                     shared['completeness'], shared['ip_list'],
+                     shared['st_dist_mass'], shared['ga_params'],
+                     shared['init_pop'])[0]
+    else:
+        params = s_o(flag_print_perc, shared['err_lst'], obs_cl,
+                     shared['completeness'], shared['ip_list'],
+                     shared['st_dist_mass'])[0]
+
+    return i, params
+
+
 def bootstrap(err_lst, memb_prob_avrg_sort, completeness, ip_list,
-              st_dist_mass):
+              st_dist_mass, isoch_fit_params):
     '''
     Bootstrap process, runs the selected algorithm a number of times each
     time generating a new observed cluster representation through resampling
     with replacement.
+
+    If more than one process was selected, the runs are distributed among
+    them. Each run gets its own seed, so the results do not depend on the
+    number of processes used.
+
+    The runs can be warm started from the best models found by the main fit
+    ('isoch_fit_params'), with a reduced number of generations.
     '''
 
-    best_fit_algor, N_b = g.bf_params[1], g.bf_params[-1]
+    N_b = g.bf_params[-1]
 
     print 'Begin bootstrap process (%d).' % N_b
 
+    # Observed cluster as an array of floats, resampled in each run.
+    obs_arr = np.array(memb_prob_avrg_sort, dtype=float)
+    ga_params, init_pop = boot_ga_params(isoch_fit_params)
+    init_data(err_lst, obs_arr, completeness, ip_list, st_dist_mass,
+              ga_params, init_pop)
+    jobs = zip(*[range(N_b), np.random.randint(0, 2 ** 31 - 1, N_b)])
+
+    n_proc, pool = min(p_e.num_proc(), N_b), None
+    if n_proc > 1:
+        pool = Pool(n_proc, initializer=init_data, initargs=(
+            err_lst, obs_arr, completeness, ip_list, st_dist_mass,
+            ga_params, init_pop, True))
+        results = pool.imap_unordered(boot_run, jobs)
+    else:
+        # Store the state of the generators so that the seeding done for
+        # each run does not affect the caller.
+        np_state, py_state = np.random.get_state(), random.getstate()
+        results = (boot_run(job) for job in jobs)
+
     # List that holds the parameters values obtained by the bootstrap
-    # process.
-    params_boot = []
+    # process, in the order of the runs.
+    params_boot = [None] * N_b
 
     milestones = [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]
-    # Begin bootstrap block (run a minimum of two times).
-    for i in range(N_b):
-
-        # Resample cluster with replacement.
-        obs_cl_r = resample_replacement(memb_prob_avrg_sort)
-        # Obtain prepared observed cluster according to the likelihood method
-        # selected.
-        obs_cl = prep(obs_cl_r)
-
-        # Algorithm selected.
-        if best_fit_algor == 'genet':
-            # Let the GA algor know this call comes from the bootstrap
-            # process so it will not print percentages to screen.
-            flag_print_perc = False
-            params_boot.append(g_a(flag_print_perc, err_lst, obs_cl,
-                               completeness, ip_list, st_dist_mass)[0])
-
-        percentage_complete = (100.0 * (i + 1) / max(N_b, 2))
-        while len(milestones) > 0 and percentage_complete >= milestones[0]:
-            print "  {}% done".format(milestones[0])
-            # Remove that milestone from the list.
-            milestones = milestones[1:]
+    try:
+        # Collect the runs as they are completed (run a minimum of two
+        # times).
+        for n, (i, params) in enumerate(results):
+            params_boot[i] = params
+
+            percentage_complete = (100.0 * (n + 1) / max(N_b, 2))
+            while len(milestones) > 0 and \
+                    percentage_complete >= milestones[0]:
+                print "  {}% done".format(milestones[0])
+                # Remove that milestone from the list.
+                milestones = milestones[1:]
+    except:
+        # Do not wait for the workers if the process failed or was
+        # interrupted.
+        p_e.stop_pool(pool, terminate=True)
+        raise
+    finally:
+        if pool is None:
+            np.random.set_state(np_state)
+            random.setstate(py_state)
+    p_e.stop_pool(pool)
 
     # Calculate errors for each parameter.
     isoch_fit_errors = np.std(params_boot, 0)
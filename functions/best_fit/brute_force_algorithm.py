@@ -6,75 +6,129 @@ Created on Fri Jan 17 16:38:10 2014
 """
 
 import numpy as np
-from get_likelihood import isoch_likelihood as i_l
+import hashlib
+import cPickle
+from os.path import isfile
+from .._in import get_in_params as g
+import parallel_eval as p_e
 
 
-def brute_force(err_lst, obs_clust, completeness, ip_list, st_d_bin_mr):
+def grid_key(err_lst, obs_clust, completeness, param_values):
     '''
-    Brute force algorithm that computes the likelihoods for *all* the defined
-    isochrones.
+    Short hash that identifies the grid of models and the data they are
+    compared to. Used to name the files holding the results so that a run
+    is only resumed from files generated with the same input. The set of
+    isochrones is identified by its path, CMD, version and precision.
     '''
+    key_data = [err_lst, obs_clust, completeness, param_values,
+                g.bf_params[2:4], g.sc_params, g.ps_params[:4]]
+    key = hashlib.md5(cPickle.dumps(key_data, 2)).hexdigest()[:10]
 
-    isoch_list, param_values = ip_list
-
-    # Unpack parameters values.
-    m_lst, a_lst, e_lst, d_lst, mass_lst, bin_lst = param_values
-
-    # Initiate list that will hold the likelihood values telling us how well
-    # each isochrone (synthetic cluster) fits the observed data.
-    model_done = [[], []]
-
-    tot_sols, i = reduce(lambda x, y: x * y,
-                         [len(_) for _ in param_values], 1), 0
-
-    milestones = [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]
-    # Iterate through all metallicities.
-    for m_i, m in enumerate(m_lst):
-
-        # Iterate through all ages.
-        for a_i, a in enumerate(a_lst):
-
-            # # Age-mass relation.
-            # age_mass = 10 ** (1.8 * a - 12.8)
-            # mass_lst = [age_mass]
+    return key
 
-            # Iterate through all extinction values.
-            for e in e_lst:
 
-                # Iterate through all distance modulus.
-                for d in d_lst:
+def grid_chunks(N_models, N_chunk):
+    '''
+    Partition the flattened grid of models into chunks, each one with its
+    own seed.
+    '''
+    i0 = np.arange(0, N_models, N_chunk)
+    i1 = np.minimum(i0 + N_chunk, N_models)
+    seeds = np.random.randint(0, 2 ** 31 - 1, len(i0))
 
-                    # Iterate through all masses.
-                    for mass in mass_lst:
+    return zip(*[i0, i1, seeds])
 
-                        # Iterate through all binary fractions.
-                        for bin_frac in bin_lst:
 
-                            params = [m, a, e, d, mass, bin_frac]
+def brute_force(err_lst, obs_clust, completeness, ip_list, st_d_bin_mr,
+                bf_file):
+    '''
+    Brute force algorithm that computes the likelihoods for *all* the defined
+    isochrones.
 
-                            # Call likelihood function with m,a,e,d values.
-                            isochrone = isoch_list[m_i][a_i]
-                            # Call likelihood function with m,a,e,d values.
-                            likel_val = i_l(err_lst, obs_clust, completeness,
-                                            st_d_bin_mr, isochrone, params)
-                            # Store the likelihood for each synthetic cluster.
-                            model_done[0].append(params)
-                            model_done[1].append(likel_val)
+    The grid of models is split into chunks that are evaluated by the pool of
+    processes (if more than one process was selected). The likelihoods are
+    stored as soon as each chunk is processed in a .npy file, with one
+    dimension per parameter, so an interrupted run is resumed from the last
+    chunks completed.
+    '''
 
-                            # Print percentage done.
-                            i += 1
-                            percentage_complete = (100.0 * (i + 1) / tot_sols)
-                            while len(milestones) > 0 and \
-                                    percentage_complete >= milestones[0]:
-                                print " {:>3}% done".format(milestones[0])
-                                # Remove that milestone from the list.
-                                milestones = milestones[1:]
+    param_values = ip_list[1]
+    grid_shape = tuple(len(_) for _ in param_values)
+    tot_sols = reduce(lambda x, y: x * y, grid_shape, 1)
+
+    # Number of models per chunk. Small grids are split into ~100 chunks so
+    # the work is balanced between processes. This number must not depend on
+    # the number of processes, so a run can be resumed with a different one.
+    N_chunk = int(min(1000, max(1, tot_sols // 100)))
+    chunks = grid_chunks(tot_sols, N_chunk)
+
+    # Files that store the likelihoods for the entire grid, and the chunks
+    # already processed.
+    key = grid_key(err_lst, obs_clust, completeness, param_values)
+    lkl_file = bf_file + '_brute_' + key + '.npy'
+    done_file = bf_file + '_brute_' + key + '_done.npy'
+
+    if isfile(lkl_file) and isfile(done_file):
+        # Resume a previous run.
+        lkl_grid = np.load(lkl_file, mmap_mode='r+')
+        chunks_done = np.load(done_file, mmap_mode='r+')
+        print ' Resuming from {} chunks processed.'.format(chunks_done.sum())
+    else:
+        lkl_grid = np.lib.format.open_memmap(
+            lkl_file, mode='w+', dtype=float, shape=grid_shape)
+        chunks_done = np.lib.format.open_memmap(
+            done_file, mode='w+', dtype=bool, shape=(len(chunks),))
+    lkl_flat = lkl_grid.reshape(-1)
+
+    # Store the data needed to evaluate the models and start the pool of
+    # processes, if more than one was selected.
+    pool = p_e.start_pool(err_lst, obs_clust, completeness, st_d_bin_mr,
+                          ip_list)
+
+    try:
+        chunks_left = [ch for i, ch in enumerate(chunks) if not chunks_done[i]]
+        i = tot_sols - sum(i1 - i0 for i0, i1, _ in chunks_left)
+        milestones = [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]
+        for i0, likel_chunk in p_e.eval_chunks(chunks_left, pool):
+
+            # Store the likelihood for each synthetic cluster in this chunk,
+            # and then flag the chunk as processed.
+            lkl_flat[i0:i0 + len(likel_chunk)] = likel_chunk
+            lkl_grid.flush()
+            chunks_done[i0 // N_chunk] = True
+            chunks_done.flush()
+
+            # Print percentage done.
+            i += len(likel_chunk)
+            percentage_complete = (100.0 * i / tot_sols)
+            while len(milestones) > 0 and \
+                    percentage_complete >= milestones[0]:
+                print " {:>3}% done".format(milestones[0])
+                # Remove that milestone from the list.
+                milestones = milestones[1:]
+    except:
+        # Do not wait for the workers if the process failed or was
+        # interrupted.
+        p_e.stop_pool(pool, terminate=True)
+        raise
+    p_e.stop_pool(pool)
 
     # Find index of function with smallest likelihood value.
     # This index thus points to the isochrone that best fits the observed
     # group of stars.
-    best_fit_indx = np.argmin(model_done[1])
-
-    isoch_fit_params = [model_done[0][best_fit_indx], model_done]
+    best_fit_indx = np.argmin(lkl_flat)
+    best_lik = lkl_flat[best_fit_indx]
+
+    # Only keep in memory the models with a likelihood closer than 5% to the
+    # minimum, which are the only ones used by the 'top tiers' function. The
+    # likelihoods for all the models are stored in the .npy file.
+    top_indx = np.flatnonzero((lkl_flat - best_lik) <= abs(best_lik) * 0.05)
+    top_indx = top_indx[np.argsort(lkl_flat[top_indx], kind='mergesort')]
+    grid_idx = np.unravel_index(top_indx, grid_shape)
+    model_done = [[], list(lkl_flat[top_indx])]
+    for idx in zip(*grid_idx):
+        model_done[0].append([p_v[i] for p_v, i in zip(*[param_values, idx])])
+
+    isoch_fit_params = [model_done[0][0], model_done]
 
     return isoch_fit_params
@@ -7,8 +7,10 @@ Created on Fri Jan 17 09:43:14 2014
 
 import random
 import numpy as np
+from collections import OrderedDict
 from .._in import get_in_params as g
-from get_likelihood import isoch_likelihood as i_l
+import parallel_eval as p_e
+import models_cache as m_c
 
 #############################################################
 # # Timer function: http://stackoverflow.com/a/21860100/1391441
@@ -131,6 +133,73 @@ def decode(param_values, n_bin, p_delta, p_mins, mut_chrom):
     return p_lst
 
 
+def encode_int(p_index, int_popul):
+    '''
+    Encode the solutions into integer chromosomes to be bred: one row per
+    solution holding the index of each parameter value in its list of values.
+    '''
+    chromosomes = np.array([[p_idx[p] for p_idx, p in zip(*[p_index, sol])]
+                            for sol in int_popul], dtype=int)
+
+    return chromosomes
+
+
+def crossover_int(chromosomes, p_cross, cr_sel):
+    '''
+    Applies the crossover operator over each pair of subsequent integer
+    chromosomes. The crossover points are located between genes (ie:
+    parameters).
+    '''
+    chrom_0, chrom_1 = chromosomes[0::2], chromosomes[1::2]
+    n_pairs, n_genes = chrom_0.shape
+
+    # Select the crossover points for each pair. The genes between them are
+    # exchanged.
+    if cr_sel == '1P':
+        cp0 = np.random.randint(0, n_genes + 1, n_pairs)
+        cp1 = np.full(n_pairs, n_genes, dtype=int)
+    elif cr_sel == '2P':
+        # Two different points for each pair.
+        cp0 = np.random.randint(0, n_genes, n_pairs)
+        cp1 = np.random.randint(0, n_genes - 1, n_pairs)
+        cp1 += cp1 >= cp0
+        cp0, cp1 = np.minimum(cp0, cp1), np.maximum(cp0, cp1)
+    genes = np.arange(n_genes)
+    swap = (genes >= cp0[:, None]) & (genes < cp1[:, None])
+    # Skip crossover operation for those pairs with r > p_cross.
+    swap &= (np.random.uniform(0., 1., n_pairs) <= p_cross)[:, None]
+
+    cross_chrom = np.empty_like(chromosomes)
+    cross_chrom[0::2] = np.where(swap, chrom_1, chrom_0)
+    cross_chrom[1::2] = np.where(swap, chrom_0, chrom_1)
+
+    return cross_chrom
+
+
+def mutation_int(cross_chrom, p_mut, p_len):
+    '''
+    Applies the mutation operator over random genes in each integer
+    chromosome, replacing them with a random value of the parameter.
+    '''
+    mut = np.random.uniform(0., 1., cross_chrom.shape) <= p_mut
+    new_genes = (np.random.uniform(0., 1., cross_chrom.shape) *
+                 p_len).astype(int)
+    mut_chrom = np.where(mut, new_genes, cross_chrom)
+
+    return mut_chrom
+
+
+def decode_int(param_values, mut_chrom):
+    '''
+    Decode the integer chromosomes into its real values to be evaluated by
+    the objective function.
+    '''
+    p_lst = [np.asarray(p_v)[idx].tolist() for p_v, idx in
+             zip(*[param_values, mut_chrom.T])]
+
+    return p_lst
+
+
 def elitism(best_sol, p_lst):
     '''
     Pass the best n_el solutions unchanged to the next generation.
@@ -145,85 +214,116 @@ def elitism(best_sol, p_lst):
     return p_lst_r
 
 
-def selection(generation, breed_prob):
+def selection(generation, fitness_cum, sel_method, n_tourn):
     '''
     Select random chromosomes from the chromosome list passed according to
-    the breeding probability given by their fitness.
-    '''
-    select_chrom = []
-    # Draw len(generation) random numbers uniformly distributed between [0,1)
-    ran_lst = np.random.uniform(0, sum(breed_prob), len(generation))
-    # For each of these numbers, obtain the corresponding likelihood from the
-    # breed_prob CDF.
-    gen_breed = zip(*[generation, breed_prob])
-    for r in ran_lst:
-        s = 0.
-        for sol, num in gen_breed:
-            s += num
-            if s >= r:
-                select_chrom.append(sol)
-                break
+    the breeding probability given by their fitness (roulette), or by
+    picking the best of 'n_tourn' random chromosomes (tournament).
+
+    The list of chromosomes is sorted from best to worst.
+    '''
+    n_pop = len(generation)
+    if sel_method == 'roulette':
+        # Draw n_pop random numbers uniformly distributed between [0,1)
+        # and obtain, for each of them, the corresponding chromosome from the
+        # breed_prob CDF.
+        ran_lst = np.random.uniform(0, fitness_cum[-1], n_pop)
+        sel_indx = np.searchsorted(fitness_cum, ran_lst)
+        # Prevent rounding issues in the last value of the CDF.
+        sel_indx = np.minimum(sel_indx, n_pop - 1)
+    else:
+        # The best chromosome in each tournament is the one with the
+        # smallest index.
+        sel_indx = np.random.randint(0, n_pop, (n_pop, n_tourn)).min(axis=1)
+
+    select_chrom = [generation[_] for _ in sel_indx]
 
     return select_chrom
 
 
-def evaluation(err_lst, obs_clust, completeness, isoch_list, param_values,
-               p_lst, st_dist_mass, model_done):
+def evaluation(p_lsts, model_done, cache, pool):
     '''
     Evaluate each model in the objective function to obtain the fitness of
-    each one.
+    each one. If a pool of processes is given, the models are evaluated in
+    parallel. The models of all the populations (islands) passed are
+    evaluated together.
+
+    Models already evaluated are looked up in the cache. Depending on the
+    selected mode, they are either not evaluated again ('skip'), or they are
+    re-evaluated and the minimum ('min') or average ('mean') of all their
+    likelihood values is kept.
     '''
 
-    likel_lst, generation_list = [], []
+    mc_mode = g.mc_params[0]
+    models_isl = [zip(*p_lst) for p_lst in p_lsts]
+    models = [m for models_p in models_isl for m in models_p]
+
+    # Call likelihood function for the models.
+    # with timeblock(" Likelihood"):
+    if mc_mode == 'skip':
+        # Only evaluate the models not stored in the cache, once each.
+        entries = [m_c.cache_get(cache, _) for _ in models]
+        new_models = list(OrderedDict.fromkeys(
+            [m for m, e in zip(*[models, entries]) if e is None]))
+        likel_new = dict(zip(*[new_models,
+                               p_e.eval_models(new_models, pool)]))
+    else:
+        likel_eval = p_e.eval_models(models, pool)
+
+    likel_all = []
     # Process each model selected.
-    for model in zip(*p_lst):
-
-        # Metallicity and age indexes to identify isochrone.
-        m_i = param_values[0].index(model[0])
-        a_i = param_values[1].index(model[1])
-        isochrone = isoch_list[m_i][a_i]
-
-        # Call likelihood function for this model.
-        # with timeblock(" Likelihood"):
-        likelihood = i_l(err_lst, obs_clust, completeness, st_dist_mass,
-                         isochrone, model)
+    for i, model in enumerate(models):
 
         # Check if this model was already processed. Without this check here,
         # the extinction/immigration operator becomes useless, since the best
         # solution's likelihood value can vary slightly due to the re-sampling
         # of the mass distribution.
-        # if model in model_done[0]:
         # with timeblock(" Compare"):
-        try:
-            # Get old likelihood value for this model.
-            likel_old = model_done[1][model_done[0].index(model)]
-            # Compare with new value. If old one is smaller, pass old one.
-            # This keeps the likelihood always trending downwards.
-            if likel_old < likelihood:
-                likelihood = likel_old
-        except:
-            # Model was not processed before.
-            pass
-
-        # Append data to the lists that will be erased with each call
-        # to this function.
-        generation_list.append(model)
-        likel_lst.append(likelihood)
-
-    # Sort according to the likelihood list. This puts the best model (ie:
-    # the one with the minimum likelihood value) first.
-    # with timeblock(" sort"):
-    generation = [x for y, x in sorted(zip(likel_lst, generation_list))]
-    # Sort list in place putting the likelihood minimum value first.
-    likel_lst.sort()
-
-    # Append data identifying the isochrone and the obtained
-    # likelihood value to this *persistent* list.
-    # with timeblock(" Append"):
-    model_done[0] = generation + model_done[0]
-    model_done[1] = likel_lst + model_done[1]
-
-    return generation, likel_lst, model_done
+        if mc_mode == 'skip':
+            # Use the stored likelihood if the model was already processed.
+            entry = entries[i]
+            if entry is None:
+                entry = [likel_new[model], 1]
+                m_c.cache_store(cache, model, *entry)
+            likelihood = entry[0]
+        else:
+            likelihood, n_eval = likel_eval[i], 1
+            entry = m_c.cache_get(cache, model)
+            if entry is not None:
+                n_eval = entry[1] + 1
+                if mc_mode == 'min':
+                    # Compare with new value. If old one is smaller, pass old
+                    # one. This keeps the likelihood always trending
+                    # downwards.
+                    likelihood = min(entry[0], likelihood)
+                else:
+                    # Running average of all the evaluations.
+                    likelihood = entry[0] + (likelihood - entry[0]) / n_eval
+            m_c.cache_store(cache, model, likelihood, n_eval)
+
+        likel_all.append(likelihood)
+
+    gen_lkl, i0 = [], 0
+    for generation_list in models_isl:
+        likel_lst = likel_all[i0:i0 + len(generation_list)]
+        i0 += len(generation_list)
+
+        # Sort according to the likelihood list. This puts the best model
+        # (ie: the one with the minimum likelihood value) first.
+        # with timeblock(" sort"):
+        generation = [x for y, x in sorted(zip(likel_lst, generation_list))]
+        # Sort list in place putting the likelihood minimum value first.
+        likel_lst.sort()
+
+        # Append data identifying the isochrone and the obtained
+        # likelihood value to this *persistent* list.
+        # with timeblock(" Append"):
+        model_done[0].extend(generation)
+        model_done[1].extend(likel_lst)
+
+        gen_lkl.append([generation, likel_lst])
+
+    return gen_lkl, model_done
 
 
 def random_population(param_values, n_ran):
@@ -239,6 +339,18 @@ def random_population(param_values, n_ran):
     return p_lst
 
 
+def initial_population(param_values, n_pop, init_pop):
+    '''
+    Use the first n_pop models in 'init_pop' as the initial population,
+    filled with random solutions if there are less than n_pop models.
+    '''
+    init_pop = [tuple(_) for _ in init_pop[:n_pop]]
+    p_lst_r = random_population(param_values, n_pop - len(init_pop))
+    p_lst = [list(_) for _ in zip(*(init_pop + zip(*p_lst_r)))]
+
+    return p_lst
+
+
 def ext_imm(best_sol, param_values, n_pop):
     '''
     Append a new random population to the best solution so far.
@@ -278,21 +390,68 @@ def num_binary_digits(param_values):
     return n_bin, p_delta, p_mins
 
 
+def migration(islands, n_mig):
+    '''
+    Send copies of the best n_mig solutions of each island to the next one
+    (in a ring), where they replace its worst solutions.
+    '''
+    migrants = [[isl['generation'][:n_mig], isl['lkl'][:n_mig]] for isl in
+                islands]
+    for k, isl in enumerate(islands):
+        mig_gen, mig_lkl = migrants[k - 1]
+        # Sort again so the migrants are placed according to their
+        # likelihood.
+        lkl_gen = sorted(zip(isl['lkl'][:-n_mig] + mig_lkl,
+                             isl['generation'][:-n_mig] + mig_gen))
+        isl['lkl'] = [_[0] for _ in lkl_gen]
+        isl['generation'] = [_[1] for _ in lkl_gen]
+
+
+def pop_spread(p_lsts, param_values):
+    '''
+    Spread of the solutions in the populations given: standard deviation of
+    each fitted parameter in units of its range, averaged over the
+    parameters. Also returns the fraction of distinct solutions.
+    '''
+    sols = np.array([sol for p_lst in p_lsts for sol in p_lst], dtype=float)
+    p_range = np.array([max(p_v) - min(p_v) for p_v in param_values])
+    fit = p_range > 0.
+    spread = (sols[:, fit].std(axis=0) / p_range[fit]).mean() if \
+        fit.any() else 0.
+    diversity = len(set(map(tuple, sols))) / float(len(sols))
+
+    return spread, diversity
+
+
 def gen_algor(flag_print_perc, err_lst, obs_clust, completeness, ip_list,
-              st_dist_mass):
+              st_dist_mass, ga_params=None, init_pop=()):
     '''
     Genetic algorithm adapted to find the best fit model-obervation.
+
+    The GA parameters given in the input file can be replaced by passing
+    'ga_params'. The models in 'init_pop' (if any) are used as the initial
+    population of each island, filled with random models if necessary.
     '''
 
     # Unpack.
-    isoch_list, param_values = ip_list
-    n_pop, n_gen, fdif, p_cross, cr_sel, p_mut, n_el, n_ei, n_es = g.ga_params
+    param_values = ip_list[1]
+    if ga_params is None:
+        ga_params = g.ga_params
+    n_pop, n_gen, fdif, p_cross, cr_sel, p_mut, n_el, n_ei, n_es = ga_params
     # Check if n_pop is odd. If it is sum 1 to avoid conflict if cr_sel
     # '2P' was selected.
     n_pop += n_pop % 2
 
-    # Get number of binary digits to use.
-    n_bin, p_delta, p_mins = num_binary_digits(param_values)
+    ga_encoding = g.go_params[0]
+    if ga_encoding == 'binary':
+        # Get number of binary digits to use.
+        n_bin, p_delta, p_mins = num_binary_digits(param_values)
+    else:
+        # Index of each value in its parameter's list, and number of values
+        # for each parameter.
+        p_index = [dict((p, j) for j, p in enumerate(p_v)) for p_v in
+                   param_values]
+        p_len = np.array([len(_) for _ in param_values])
 
     # Fitness.
     # Rank-based breeding probability. Independent of the fitness values,
@@ -300,138 +459,251 @@ def gen_algor(flag_print_perc, err_lst, obs_clust, completeness, ip_list,
     # differential fdif.
     fitness = [1. / n_pop + fdif * (n_pop + 1. - 2. * (i + 1.)) /
                (n_pop * (n_pop + 1.)) for i in range(n_pop)]
+    # Cumulative breeding probability, used by the selection operator.
+    fitness_cum = np.cumsum(fitness)
+    sel_method, n_tourn = g.go_params[1:3]
+
+    # Number of islands (independent populations) and number of generations
+    # between migrations.
+    n_isl, n_mig_gen = g.gi_params
+
+    # Convergence monitor: number of generations checked and tolerances for
+    # the improvement of the best likelihood and the spread of the
+    # populations.
+    conv_flag, n_win, tol_lkl, tol_spr = g.gc_params
 
     # *** Initial random population evaluation ***
-    p_lst_r = random_population(param_values, n_pop)
+    p_lsts = [initial_population(param_values, n_pop, init_pop) for _ in
+              range(n_isl)]
 
     # Stores parameters of the solutions already processed and the likelihoods
     # obtained.
     model_done = [[], []]
+    # Cache with the likelihood of each distinct model evaluated.
+    cache = m_c.new_cache(g.mc_params[1])
+
+    # Store the data needed to evaluate the models and start the pool of
+    # processes, if more than one was selected.
+    pool = p_e.start_pool(err_lst, obs_clust, completeness, st_dist_mass,
+                          ip_list)
+
+    try:
+        # Evaluate initial random solutions in the objective function.
+        gen_lkl, model_done = evaluation(p_lsts, model_done, cache, pool)
+
+        islands = []
+        for generation, lkl in gen_lkl:
+            islands.append({
+                'generation': generation, 'lkl': lkl,
+                # Store best solution for passing along in the 'Elitism' block.
+                'best_sol': generation[:n_el],
+                # Initiate counters.
+                'best_sol_count': 0, 'ext_imm_count': 0,
+                # Stores the best solution found after each application of the
+                # Extinction/Immigration operator.
+                'best_sol_ei': [],
+                # Flag for an island stopped by the exit switch.
+                'done': False})
+
+        # For plotting purposes: best and mean likelihoods, spread and fraction
+        # of distinct solutions of the populations for each generation, and the
+        # reason why the GA stopped.
+        lkl_old = [[], [], [], [], 'n_gen']
+        # Stores indexes where a new best solution was found.
+        new_bs_indx = []
+
+        # Print percentage done.
+        milestones = [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]
+        # Begin processing the populations up to n_gen generations.
+        for i in range(n_gen):
+
+            # Islands still running.
+            active = [isl for isl in islands if not isl['done']]
+
+            p_lsts = []
+            for isl in active:
+                # *** Selection/Reproduction ***
+                # with timeblock("Selec/Repo"):
+                # Select chromosomes for breeding from the current generation
+                # of solutions according to breed_prob to generate the
+                # intermediate population.
+                int_popul = selection(isl['generation'], fitness_cum,
+                                      sel_method, n_tourn)
+
+                if ga_encoding == 'binary':
+                    # Encode intermediate population's solutions into binary
+                    # chromosomes.
+                    chromosomes = encode(n_bin, p_delta, p_mins, int_popul)
+
+                    # *** Breeding ***
+                    # with timeblock("Breeding"):
+                    # Pair chromosomes by randomly shuffling them.
+                    random.shuffle(chromosomes)
+
+                    # Apply crossover operation on each subsequent pair of
+                    # chromosomes with a p_cross probability (crossover
+                    # probability)
+                    cross_chrom = crossover(chromosomes, p_cross, cr_sel)
+
+                    # Apply mutation operation on random genes for every
+                    # chromosome.
+                    mut_chrom = mutation(cross_chrom, p_mut)
+
+                    # *** Evaluation ***
+                    # Decode the chromosomes into solutions to form the new
+                    # generation.
+                    # with timeblock("Decode"):
+                    p_lst_d = decode(param_values, n_bin, p_delta, p_mins,
+                                     mut_chrom)
+                else:
+                    # Same operators as above, applied on integer chromosomes
+                    # that hold the indexes of the parameter values.
+                    chromosomes = encode_int(p_index, int_popul)
+                    np.random.shuffle(chromosomes)
+                    cross_chrom = crossover_int(chromosomes, p_cross, cr_sel)
+                    mut_chrom = mutation_int(cross_chrom, p_mut, p_len)
+                    p_lst_d = decode_int(param_values, mut_chrom)
+
+                # Elitism: make sure that the best n_el solutions from the
+                # previous generation are passed unchanged into this next
+                # generation.
+                # with timeblock("Elitism"):
+                p_lsts.append(elitism(isl['best_sol'], p_lst_d))
+
+            # Evaluate each new solution in the objective function and sort
+            # according to the best solutions found. The solutions of all the
+            # islands are evaluated together.
+            # with timeblock("Evaluation"):
+            gen_lkl, model_done = evaluation(p_lsts, model_done, cache, pool)
+
+            for isl, (generation, lkl) in zip(*[active, gen_lkl]):
+                isl['generation'], isl['lkl'] = generation, lkl
+
+            # *** Migration ***
+            # Exchange the best solutions between the islands still running,
+            # every n_mig_gen generations.
+            if len(active) > 1 and (i + 1) % n_mig_gen == 0:
+                migration(active, n_el)
+
+            # Spread of the populations just evaluated.
+            spread, diversity = pop_spread(
+                [isl['generation'] for isl in active], param_values)
+
+            new_best = False
+            for isl in active:
+                generation, best_sol = isl['generation'], isl['best_sol']
+
+                # *** Extinction/Immigration ***
+                # If the best solution has remained unchanged for n_ei
+                # generations, remove all chromosomes but the best ones
+                # (extinction) and fill with random new solutions
+                # (immigration).
+
+                # Check if new best solution is equal to the previous one.
+                if generation[0] == best_sol[0]:
+                    # Increase counter.
+                    isl['best_sol_count'] += 1
+
+                    # Check how many times the best_sol has remained
+                    # unchanged. If the number equals n_ei, apply
+                    # Extinction/Immigration operator.
+                    if isl['best_sol_count'] == n_ei:
+
+                        # *** Exit switch ***
+                        # If n_es runs of the Ext/Imm operator have been
+                        # applied with no changes to the best solution, apply
+                        # the exit switch, ie: stop this island.
+                        if best_sol[0] == isl['best_sol_ei']:
+                            # Increase Ext/Imm operator counter.
+                            isl['ext_imm_count'] += 1
+                            if isl['ext_imm_count'] == n_es:
+                                isl['done'] = True
+                                continue
+                        else:
+                            # Update best solution.
+                            isl['best_sol_ei'] = best_sol[0]
+                            # Reset counter.
+                            isl['ext_imm_count'] = 0
+
+                        # Apply Extinction/Immigration operator.
+                        isl['generation'] = ext_imm(best_sol, param_values,
+                                                    n_pop)
+
+                        # Reset best solution counter.
+                        isl['best_sol_count'] = 0
 
-    # Evaluate initial random solutions in the objective function.
-    generation, lkl, model_done = evaluation(
-        err_lst, obs_clust, completeness, isoch_list, param_values, p_lst_r,
-        st_dist_mass, model_done)
-
-    # Store best solution for passing along in the 'Elitism' block.
-    best_sol = generation[:n_el]
-
-    # For plotting purposes.
-    lkl_old = [[], []]
-    # Stores indexes where a new best solution was found.
-    new_bs_indx = []
-
-    # Initiate counters.
-    best_sol_count, ext_imm_count = 0, 0
-    # Initiate empty list. Stores the best solution found after each
-    # application of the Extinction/Immigration operator.
-    best_sol_ei = []
-
-    # Print percentage done.
-    milestones = [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]
-    # Begin processing the populations up to n_gen generations.
-    for i in range(n_gen):
-
-        # *** Selection/Reproduction ***
-        # with timeblock("Selec/Repo"):
-        # Select chromosomes for breeding from the current generation of
-        # solutions according to breed_prob to generate the intermediate
-        # population.
-        int_popul = selection(generation, fitness)
-
-        # Encode intermediate population's solutions into binary
-        # chromosomes.
-        chromosomes = encode(n_bin, p_delta, p_mins, int_popul)
-
-        # *** Breeding ***
-        # with timeblock("Breeding"):
-        # Pair chromosomes by randomly shuffling them.
-        random.shuffle(chromosomes)
-
-        # Apply crossover operation on each subsequent pair of chromosomes
-        # with a p_cross probability (crossover probability)
-        cross_chrom = crossover(chromosomes, p_cross, cr_sel)
-
-        # Apply mutation operation on random genes for every chromosome.
-        mut_chrom = mutation(cross_chrom, p_mut)
-
-        # *** Evaluation ***
-        # Decode the chromosomes into solutions to form the new generation.
-        # with timeblock("Decode"):
-        p_lst_d = decode(param_values, n_bin, p_delta, p_mins, mut_chrom)
-
-        # Elitism: make sure that the best n_el solutions from the previous
-        # generation are passed unchanged into this next generation.
-        # with timeblock("Elitism"):
-        p_lst_e = elitism(best_sol, p_lst_d)
-
-        # Evaluate each new solution in the objective function and sort
-        # according to the best solutions found.
-        # with timeblock("Evaluation"):
-        generation, lkl, model_done = evaluation(
-            err_lst, obs_clust, completeness, isoch_list, param_values,
-            p_lst_e, st_dist_mass, model_done)
-
-        # *** Extinction/Immigration ***
-        # If the best solution has remained unchanged for n_ei
-        # generations, remove all chromosomes but the best ones (extinction)
-        # and fill with random new solutions (immigration).
-
-        # Check if new best solution is equal to the previous one.
-        if generation[0] == best_sol[0]:
-            # Increase counter.
-            best_sol_count += 1
-
-            # Check how many times the best_sol has remained unchanged.
-            # If the number equals n_ei, apply Extinction/Immigration operator.
-            if best_sol_count == n_ei:
-
-                # *** Exit switch ***
-                # If n_es runs of the Ext/Imm operator have been applied with
-                # no changes to the best solution, apply the exit switch,
-                # ie: exit the GA.
-                if best_sol[0] == best_sol_ei:
-                    # Increase Ext/Imm operator counter.
-                    ext_imm_count += 1
-                    if ext_imm_count == n_es:
-                        # Exit generations loop.
-                        break
                 else:
-                    # Update best solution.
-                    best_sol_ei = best_sol[0]
+                    new_best = True
+                    # Update best solution for passing along in the 'Elitism'
+                    # block.
+                    isl['best_sol'] = generation[:n_el]
                     # Reset counter.
-                    ext_imm_count = 0
+                    isl['best_sol_count'] = 0
 
-                # Apply Extinction/Immigration operator.
-                generation = ext_imm(best_sol, param_values, n_pop)
-
-                # Reset best solution counter.
-                best_sol_count = 0
+            # Exit generations loop when all the islands were stopped.
+            if all(isl['done'] for isl in islands):
+                lkl_old[4] = 'exit switch'
+                break
 
-        else:
             # For plotting purposes. Save index where a new best solution
             # was found.
-            new_bs_indx.append([i])
-            # Update best solution for passing along in the 'Elitism' block.
-            best_sol = generation[:n_el]
-            # Reset counter.
-            best_sol_count = 0
-
-        # For plotting purposes.
-        lkl_old[0].append(lkl[0])
-        # Discard large values associated with empty arrays from mean.
-        lkl_old[1].append(np.mean(np.asarray(lkl)[np.asarray(lkl) < 9.9e08]))
-
-        if flag_print_perc:
-            percentage_complete = (100.0 * (i + 1) / n_gen)
-            while len(milestones) > 0 and percentage_complete >= milestones[0]:
-                print (" {:>3}% done  L={:.1f} ({:g}, {:g}, {:g}, {:g}, {:g},"
-                       " {:g})".format(milestones[0], lkl[0], *generation[0]))
-                # Remove that milestone from the list.
-                milestones = milestones[1:]
-
-        # print i, generation[0], lkl[0], len(model_done[0])
-
-    isoch_fit_params = [generation[0], lkl_old, new_bs_indx, model_done]
+            if new_best:
+                new_bs_indx.append([i])
+
+            # Best solution among all the islands.
+            best_isl = min(islands, key=lambda isl: isl['lkl'][0])
+            lkl, generation = best_isl['lkl'], best_isl['generation']
+
+            # For plotting purposes.
+            lkl_old[0].append(lkl[0])
+            # Discard large values associated with empty arrays from mean.
+            lkl_all = np.concatenate([isl['lkl'] for isl in islands if not
+                                      isl['done']])
+            lkl_old[1].append(np.mean(lkl_all[lkl_all < 9.9e08]))
+            lkl_old[2].append(spread)
+            lkl_old[3].append(diversity)
+
+            if flag_print_perc:
+                percentage_complete = (100.0 * (i + 1) / n_gen)
+                while len(milestones) > 0 and \
+                        percentage_complete >= milestones[0]:
+                    print (" {:>3}% done  L={:.1f} ({:g}, {:g}, {:g}, {:g},"
+                           " {:g}, {:g})".format(milestones[0], lkl[0],
+                                                 *generation[0]))
+                    # Remove that milestone from the list.
+                    milestones = milestones[1:]
+
+            # *** Convergence monitor ***
+            # Stop if the best likelihood improved less than the tolerance in
+            # the last n_win generations, or if the populations stayed within
+            # the spread tolerance during those generations.
+            if conv_flag and i >= n_win:
+                if lkl_old[0][-1 - n_win] - lkl[0] <= tol_lkl * abs(lkl[0]):
+                    lkl_old[4] = 'likelihood'
+                elif max(lkl_old[2][-n_win:]) <= tol_spr:
+                    lkl_old[4] = 'spread'
+                if lkl_old[4] != 'n_gen':
+                    break
+
+            # print i, generation[0], lkl[0], len(model_done[0])
+    except:
+        # Do not wait for the workers if the process failed or was
+        # interrupted.
+        p_e.stop_pool(pool, terminate=True)
+        raise
+    p_e.stop_pool(pool)
+
+    if flag_print_perc:
+        if lkl_old[4] != 'n_gen':
+            print (" GA stopped after {} generations ({}).".format(
+                len(lkl_old[0]), lkl_old[4]))
+        print (" Models cache: {} hits, {} misses ({} models stored).".format(
+            cache['hits'], cache['misses'], len(cache['models'])))
+
+    # Best solution among all the islands.
+    best_isl = min(islands, key=lambda isl: isl['lkl'][0])
+
+    isoch_fit_params = [best_isl['generation'][0], lkl_old, new_bs_indx,
+                        model_done]
 
     return isoch_fit_params
@@ -5,15 +5,23 @@ Created on Wed Feb  5 17:11:11 2014
 @author: gabriel
 """
 
+import os
 import numpy as np
-from scipy.integrate import quad
+from os.path import join, dirname, isfile
 from .._in import get_in_params as g
 
 
+# Tables already obtained in this run, keyed by
+# (IMF, m_low, m_high, m_step, N_sub).
+imf_tables = {}
+
+
 def imfs(imf_name, m_star):
     '''
-    Define any number of IMFs.
+    Define any number of IMFs. Evaluated for an array of masses.
     '''
+    m_star = np.asarray(m_star, dtype=float)
+
     if imf_name == 'kroupa_1993':
         # Kroupa, Tout & Gilmore. (1993) piecewise IMF.
         # http://adsabs.harvard.edu/abs/1993MNRAS.262..545K
@@ -22,13 +30,8 @@ def imfs(imf_name, m_star):
         m_i = [0.08, 0.5, 1.]
         m0, m1, m2 = m_i
         factor = [0.035, 0.019, 0.019]
-        if m0 < m_star <= m1:
-            i = 0
-        elif m1 < m_star <= m2:
-            i = 1
-        elif m2 < m_star:
-            i = 2
-        imf_val = factor[i] * (m_star ** alpha[i])
+        i = np.searchsorted([m1, m2], m_star)
+        imf_val = np.take(factor, i) * (m_star ** np.take(alpha, i))
 
     elif imf_name == 'kroupa_2002':
         # Kroupa (2002) piecewise IMF (taken from MASSCLEAN article).
@@ -38,13 +41,8 @@ def imfs(imf_name, m_star):
         m0, m1, m2 = [0.01, 0.08, 0.5]
         factor = [(1. / m1) ** alpha[0], (1. / m1) ** alpha[1],
             ((m2 / m1) ** alpha[1]) * ((1. / m2) ** alpha[2])]
-        if m0 < m_star <= m1:
-            i = 0
-        elif m1 < m_star <= m2:
-            i = 1
-        elif m2 < m_star:
-            i = 2
-        imf_val = factor[i] * (m_star ** alpha[i])
+        i = np.searchsorted([m1, m2], m_star)
+        imf_val = np.take(factor, i) * (m_star ** np.take(alpha, i))
 
     elif imf_name == 'chabrier_2001_log':
         # Chabrier (2001) lognormal form of the IMF.
@@ -63,27 +61,54 @@ def imfs(imf_name, m_star):
     return imf_val
 
 
-def integral_IMF_M(m_star, imf_sel):
+def cumul_trapz(y, x):
     '''
-    Return the properly normalized function to perform the integration of the
-    selected IMF. Returns mass values.
+    Cumulative integral of y(x) using the trapezoidal rule, starting at zero.
     '''
-    imf_val = m_star * imfs(imf_sel, m_star)
-    return imf_val
+    return np.concatenate([[0.], np.cumsum(0.5 * (y[1:] + y[:-1]) *
+                                           np.diff(x))])
 
 
-def integral_IMF_N(m_star, imf_sel):
+def imf_table(imf_sel, m_low, m_high, m_step, N_sub=100):
     '''
-    Return the properly normalized function to perform the integration of the
-    selected IMF. Returns number of stars.
+    Returns the limits of the mass intervals and the normalized cumulative
+    number of stars up to each of them, for the selected IMF.
+
+    The IMF is integrated on a fine grid with 'N_sub' points per mass
+    interval.
     '''
-    imf_val = imfs(imf_sel, m_star)
-    return imf_val
+    # Number of mass intervals. The last one can go beyond m_high.
+    N_int = int(np.ceil((m_high - m_low) / m_step - 1e-9))
+    m_edges = m_low + m_step * np.arange(N_int + 1)
+    m_fine = np.linspace(m_low, m_edges[-1], N_int * N_sub + 1)
+    imf_fine = imfs(imf_sel, m_fine)
+
+    # Obtain normalization constant. This is equivalent to 'k' in Eq. (7)
+    # of Popescu & Hanson 2009 (138:1724-1740; PH09). The mass is integrated
+    # only up to m_high.
+    in_range = m_fine <= m_high
+    m_range = np.append(m_fine[in_range], m_high)
+    imf_range = np.append(imf_fine[in_range], imfs(imf_sel, m_high))
+    norm_const = 1. / cumul_trapz(m_range * imf_range, m_range)[-1]
+
+    # Obtain cumulative number of stars up to each mass interval limit.
+    # Equivalent to the upper fraction of Eq. (8) in PH09, without the total
+    # mass, accumulated over the intervals.
+    N_cum = cumul_trapz(imf_fine, m_fine)[::N_sub] * norm_const
+
+    return m_edges, N_cum
 
 
 def N_IMF():
     '''
-    Returns the number of stars per interval of mass for the selected IMF.
+    Returns the number of stars per interval of mass for the selected IMF,
+    along with the limits of all the intervals and the cumulative number of
+    stars up to each of them:
+
+    st_dist = [upper mass limits, N stars, mass limits, cumulative N stars]
+
+    The tables are stored in the isochrones folder and read from there in
+    subsequent runs.
     '''
 
     imf_sel, m_high = g.sc_params[0], g.sc_params[1]
@@ -99,27 +124,33 @@ def N_IMF():
     # For m_high > 100 Mo the differences in the resulting normalization
     # constant are negligible. This is because th IMF drops very rapidly for
     # high masses.
-    # The step (m_step) should not be too small since it will have an impact
-    # on the performance of the get_mass_dist function.
+    # The step (m_step) defines the mass intervals within which masses are
+    # uniformly distributed by the get_mass_dist function.
     m_step = 0.1
-
-    # Obtain normalization constant. This is equivalent to 'k' in Eq. (7)
-    # of Popescu & Hanson 2009 (138:1724-1740; PH09)
-    norm_const = 1. / quad(integral_IMF_M, m_low, m_high, args=(imf_sel))[0]
-
-    # Obtain number of stars in each mass interval. Equivalent to the upper
-    # fraction of Eq. (8) in PH09, without the total mass.
-    st_dist = [[], []]
-    m_upper = m_low
-    while m_upper < m_high:
-        m_lower = m_upper
-        m_upper = m_upper + m_step
-        # Number of stars in the (m_lower, m_upper) interval.
-        N_stars = quad(integral_IMF_N, m_lower, m_upper, args=(imf_sel))[0]
-        st_dist[0].append(m_upper)
-        st_dist[1].append(N_stars)
-
-    # Normalize number of stars by constant.
-    st_dist[1] = np.asarray(st_dist[1]) * norm_const
+    # Number of points per mass interval used to integrate the IMF.
+    N_sub = 100
+
+    key = (imf_sel, m_low, m_high, m_step, N_sub)
+    if key not in imf_tables:
+        imf_file = join(dirname(g.ps_params[0]),
+                        'IMF_{}_{}_{}_{}_{}.npy'.format(*key))
+        if isfile(imf_file):
+            m_edges, N_cum = np.load(imf_file)
+        else:
+            m_edges, N_cum = imf_table(*key)
+            # Write to a temporary file first, so other runs never load a
+            # file that is only partially written.
+            tmp_file = imf_file[:-4] + '_{}.npy'.format(os.getpid())
+            try:
+                np.save(tmp_file, np.array([m_edges, N_cum]))
+                os.rename(tmp_file, imf_file)
+            except (IOError, OSError):
+                print "  WARNING: could not store IMF table in:\n  {}".format(
+                    imf_file)
+        imf_tables[key] = [m_edges, N_cum]
+    m_edges, N_cum = imf_tables[key]
+
+    # Number of stars in each mass interval.
+    st_dist = [m_edges[1:], np.diff(N_cum), m_edges, N_cum]
 
     return st_dist
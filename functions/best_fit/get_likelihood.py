@@ -25,13 +25,23 @@ from .._in import get_in_params as g
 #         print ('{} elapsed: {}'.format(label, end - start))
 #############################################################
 
+# Maximum number of elements (observed x synthetic stars) in each block of
+# the matrix evaluated by the 'tolstoy' likelihood. Blocks of 2**20 elements
+# (~8 MB for each temporary array) bound the memory used without slowing
+# down the evaluation.
+tolstoy_chunk = 2 ** 20
 
-def tolstoy(Q, obs_clust):
+
+def tolstoy(Q, obs_clust, chunk_size):
     '''
     Takes a synthetic cluster, compares it to the observed cluster and
     returns the weighted (log) likelihood value.
     This function follows the recipe given in Tolstoy & Saha (1996),
     Hernandez & Valls-Gabaud (2008) and Monteiro, Dias & Caetano (2010).
+
+    The (N_obs x N_synth) matrix of Gaussian terms is evaluated in blocks of
+    observed stars, each block holding at most 'chunk_size' elements. This
+    keeps the memory used bounded for large observed/synthetic clusters.
     '''
 
     if not Q.any():
@@ -39,44 +49,44 @@ def tolstoy(Q, obs_clust):
         likelihood = 1e09
     else:
 
-        # Unpack observed cluster with squared errors and membership
-        # probabilities separated into list.
+        # Unpack observed cluster (magnitudes, colors and their squared
+        # errors stored as rows) and membership probabilities.
         P, mem_probs = obs_clust
+        obs_mag, obs_e_mag_2, obs_col, obs_e_col_2 = P
 
-        # Store synthetic clusters as array.
-        # syn_arr = np.array(zip(*(zip(*obs_arr)[:-2])))  # Observed cluster.
-        syn_arr = np.array(zip(*Q))
-        cl_stars_probs = []
-
-        # Split syn_arr.
-        Q = np.split(syn_arr, 5, axis=1)
-        # Square synthetic photometric errors.
-        Q[1] = np.square(Q[1])
-        Q[3] = np.square(Q[3])
+        # Synthetic cluster's colors, magnitudes and squared photometric
+        # errors.
+        syn_col, syn_mag = Q[0], Q[2]
+        syn_e_col_2, syn_e_mag_2 = np.square(Q[1]), np.square(Q[3])
+        N_obs, N_syn = len(obs_mag), len(syn_mag)
 
         # Small value used to replace zeros.
         epsilon = 1e-10
-        for star in P:
+        # Number of observed stars processed in each block.
+        step = max(1, chunk_size // N_syn)
+        cl_stars_probs = np.empty(N_obs)
+        for i in xrange(0, N_obs, step):
+            s = slice(i, i + step)
             # Squares sum of errors.
-            e_col_2 = np.maximum(star[5] + Q[1], epsilon)
-            e_mag_2 = np.maximum(star[3] + Q[3], epsilon)
-            # star[4] & Q[0] = colors
-            # star[2] & Q[2] = magnitudes
-            B = np.square(star[4] - Q[0]) / e_col_2
-            C = np.square(star[2] - Q[2]) / e_mag_2
+            e_col_2 = np.maximum(obs_e_col_2[s, None] + syn_e_col_2, epsilon)
+            e_mag_2 = np.maximum(obs_e_mag_2[s, None] + syn_e_mag_2, epsilon)
+            B = np.square(obs_col[s, None] - syn_col) / e_col_2
+            C = np.square(obs_mag[s, None] - syn_mag) / e_mag_2
             star_prob = np.exp(-0.5 * (B + C)) / np.sqrt(e_col_2 * e_mag_2)
-            # The final prob for this cluster star is the sum over all
-            # synthetic stars. Use 1e-10 to avoid nan and inf values in the
-            # calculations that follow.
-            cl_stars_probs.append(max(star_prob.sum(), epsilon))
+            # The final prob for each cluster star is the sum over all
+            # synthetic stars.
+            cl_stars_probs[s] = star_prob.sum(axis=1)
+        # Use 1e-10 to avoid nan and inf values in the calculations that
+        # follow.
+        np.maximum(cl_stars_probs, epsilon, out=cl_stars_probs)
 
         # Weight probabilities for each cluster star.
-        clust_prob = cl_stars_probs * mem_probs / len(syn_arr)
+        clust_prob = cl_stars_probs * mem_probs / N_syn
 
         # Final score: sum log likelihoods for each star in cluster.
-        likelihood = -sum(np.log(np.asarray(clust_prob[0])))
+        likelihood = -np.log(clust_prob).sum()
 
-        # n, p = len(P), len(syn_arr)
+        # n, p = len(P), N_syn
 
         # BIC
         # likelihood = 2 * likelihood + p * np.log(n)
@@ -93,12 +103,12 @@ def tolstoy(Q, obs_clust):
         # fig = plt.figure()
         # ax1 = fig.add_subplot(1, 2, 1)
         # ax2 = fig.add_subplot(1, 2, 2)
-        # ax1.scatter(zip(*P)[4], zip(*P)[2], c='r')
+        # ax1.scatter(P[2], P[0], c='r')
         # ax2.scatter(Q[0], Q[2], c='b')
-        # text = 'N = {}'.format(len(zip(*P)[4]))
+        # text = 'N = {}'.format(N_obs)
         # ax1.text(0.6, 0.9, text, transform=ax1.transAxes)
         # text1 = 'L = {:.2f}\n'.format(likelihood)
-        # text2 = 'N = {}'.format(len(syn_arr))
+        # text2 = 'N = {}'.format(N_syn)
         # text = text1 + text2
         # ax2.text(0.5, 0.9, text, transform=ax2.transAxes)
         # ax1.invert_yaxis()
@@ -183,6 +193,34 @@ def dolphin_plot(Q, P, b_rx, b_ry, cl_histo, syn_histo, likel):
     plt.show()
 
 
+def synth_histo(Q, b_edges):
+    '''
+    Returns the flattened 2D histogram of the synthetic cluster, obtained
+    with the bin edges defined for the observed cluster. Stars are binned
+    following the same rules as in np.histogramdd: the last bin in each
+    dimension is closed on the right and stars outside the grid are ignored.
+    '''
+    # Magnitude and color for the synthetic cluster.
+    syn_mags_cols = [Q[0], Q[2]]
+
+    cell_indx = 0
+    in_grid = np.ones(len(Q[0]), dtype=bool)
+    for dat, b_e in zip(*[syn_mags_cols, b_edges]):
+        N_b = len(b_e) - 1
+        # Bin index for each star in this dimension.
+        indx = np.searchsorted(b_e, dat, side='right') - 1
+        # Stars located on the right-most edge belong to the last bin.
+        indx[dat == b_e[-1]] = N_b - 1
+        in_grid &= (indx >= 0) & (indx < N_b)
+        cell_indx = cell_indx * N_b + indx
+
+    # Count stars in each cell of the flattened grid.
+    N_cells = np.prod([len(_) - 1 for _ in b_edges])
+    syn_histo = np.bincount(cell_indx[in_grid], minlength=N_cells)
+
+    return syn_histo
+
+
 def dolphin(Q, P):
     '''
     Takes a synthetic cluster, compares it to the observed cluster and
@@ -195,77 +233,50 @@ def dolphin(Q, P):
         poiss_lkl = 1e09
     else:
 
-        # Observed cluster's histogram.
-        cl_histo = P[0]
-        # Bin edges for each dimension.
-        b_rx, b_ry = P[1]
+        # Bin edges for each dimension, indexes and weights of the cells with
+        # observed stars in the flattened histogram.
+        b_edges, cl_cells, cl_weights = P[1], P[3], P[4]
 
-        # with timeblock("  Histodd"):
-        # Magnitude and color for the synthetic cluster.
-        syn_mags_cols = np.array(zip(*[Q[0], Q[2]]))
-        # Histogram of the synthetic cluster, using the bin edges calculated
-        # with the observed cluster.
-        syn_histo = np.histogramdd(syn_mags_cols, bins=[b_rx, b_ry])[0]
+        # Flattened histogram of the synthetic cluster, using the bin edges
+        # calculated with the observed cluster.
+        syn_histo = synth_histo(Q, b_edges)
 
-        # with timeblock("  log(lkl)"):
         # Small value used to replace zeros.
         epsilon = 1e-10
-        # Obtain inverse logarithmic 'Poisson likelihood ratio'.
-        poiss_lkl = len(Q[0])
-        for el1 in zip(*(cl_histo, syn_histo)):
-            for el2 in zip(*(el1[0], el1[1])):
-                c = -1. * el2[0] * np.log(max(el2[1], epsilon))
-                poiss_lkl += c
+        # Obtain inverse logarithmic 'Poisson likelihood ratio'. Only cells
+        # with observed stars contribute to the sum.
+        poiss_lkl = len(Q[0]) - (cl_weights * np.log(
+            np.maximum(syn_histo[cl_cells], epsilon))).sum()
 
         # Call this function to see histograms produced.
         # *IMPORTANT*: The list passed in obs_clust_prepare must be modified
         # for this block to work.
-        # dolphin_plot(Q, P, b_rx, b_ry, cl_histo, syn_histo, poiss_lkl)
+        # dolphin_plot(Q, P, b_edges[0], b_edges[1], P[0],
+        #              syn_histo.reshape(P[0].shape), poiss_lkl)
 
     return poiss_lkl
 
 
 def mighell(Q, P):
     '''
+    Takes a synthetic cluster, compares it to the observed cluster and
+    returns the chi-square value defined in Mighell (1999).
     '''
 
     if not Q.any():
         chi = 10000.
     else:
 
-        # Observed cluster's histogram.
-        cl_histo = P[0]
-        # Bin edges for each dimension.
-        b_rx, b_ry = P[1]
+        # Bin edges for each dimension and flattened histogram of the
+        # observed cluster.
+        b_edges, cl_histo_f = P[1], P[2]
 
-        # Magnitude and color for the synthetic cluster.
-        syn_mags_cols = np.array(zip(*[Q[0], Q[2]]))
-        # Histogram of the synthetic cluster, using the bin edges calculated
-        # with the observed cluster.
-        syn_histo = np.histogramdd(syn_mags_cols, bins=[b_rx, b_ry])[0]
+        # Flattened histogram of the synthetic cluster, using the bin edges
+        # calculated with the observed cluster.
+        syn_histo = synth_histo(Q, b_edges)
 
-        chi = 0.
-        for el1 in zip(*(cl_histo, syn_histo)):
-            for el2 in zip(*(el1[0], el1[1])):
-                c = np.square(el2[0] + min(el2[0], 1) - el2[1]) / (el2[0] + 1)
-                chi += c
-
-        # print len(Q[0]), chi
-        # import matplotlib.pyplot as plt
-        # fig = plt.figure()
-        # ax1 = fig.add_subplot(1, 3, 1)
-        # ax2 = fig.add_subplot(1, 3, 2)
-        # ax3 = fig.add_subplot(1, 3, 3)
-        # ax1.imshow(d_1.transpose(), origin='lower', aspect='auto')
-        # ax2.imshow(d_2.transpose(), origin='lower', aspect='auto')
-        # ax3.scatter(P[4], P[2], c='r')
-        # ax3.scatter(Q[0], Q[2], c='b')
-        # text1 = 'chi = {:.2f}\n'.format(chi)
-        # text2 = 'N = {}'.format(len(Q[0]))
-        # text = text1 + text2
-        # ax3.text(0.05, 0.9, text, transform=ax3.transAxes)
-        # fig.subplots_adjust(hspace=1)
-        # plt.show()
+        chi = (np.square(cl_histo_f + np.minimum(cl_histo_f, 1) - syn_histo) /
+               (cl_histo_f + 1)).sum()
 
     return chi
 
@@ -288,9 +299,10 @@ def isoch_likelihood(err_lst, obs_clust, completeness, st_dist_mass, isochrone,
     # with the observed cluster.
     lkl_method = g.bf_params[2]
     if lkl_method == 'tolstoy':
-        likelihood = tolstoy(synth_clust, obs_clust)
-    else:
+        likelihood = tolstoy(synth_clust, obs_clust, tolstoy_chunk)
+    elif lkl_method == 'dolphin':
         likelihood = dolphin(synth_clust, obs_clust)
-        # likelihood = mighell(synth_clust, obs_clust)
+    else:
+        likelihood = mighell(synth_clust, obs_clust)
 
     return likelihood
@@ -8,6 +8,7 @@ Created on Wed Jan 15 15:26:39 2014
 # http://www.astro.ru.nl/~slarsen/teaching/Galaxies/cmd.pdf
 # http://python4mpia.github.io/fitting_data/MC-sampling-from-Salpeter.html
 import numpy as np
+from .._in import get_in_params as g
 
 
 def mass_dist(st_dist, M_total):
@@ -15,30 +16,23 @@ def mass_dist(st_dist, M_total):
     Returns a mass distribution according to a given IMF and a total cluster
     mass.
     '''
-    # Generate a number N of stars for each interval (m, m+dm) with masses
-    # randomly distributed within the limiting masses that delimit the
-    # interval, ie: (m, m+dm).
+    # The IMF's cumulative number of stars (per unit of total mass) is
+    # inverted to obtain the masses of stars drawn from a uniform
+    # distribution. Within each (m, m+dm) interval masses are uniformly
+    # distributed.
+    m_edges, N_cum = st_dist[2], st_dist[3]
 
-    # Normalize number of stars per interval of mass according to total mass.
-    mass_up, N_stars = st_dist[0], st_dist[1] * M_total
+    # Total number of stars in the cluster, normalized according to the total
+    # mass. It is either rounded to the nearest integer or, if selected,
+    # drawn from a Poisson distribution with that mean.
+    N_mean = N_cum[-1] * M_total
+    if g.sc_params[3] == 'poisson':
+        N_total = np.random.poisson(N_mean)
+    else:
+        N_total = int(round(N_mean))
 
-    # Generate stars in each interval.
-    dist_mass = []
-    m_low, N_st_add = 0.01, 0.
-    for m_up, N_st in zip(*[mass_up, N_stars]):
-        N_st += N_st_add
-        # If the number of stars in the interval is less than 1, combine as
-        # many adjacent intervals as necessary until it reaches at least one
-        # star and then generate that star(s) with a random mass in the
-        # m_low, m_up interval.
-        if N_st < 1.:
-            # Store this fraction to be added with the next one.
-            N_st_add = N_st
-        else:
-            # Generate N_st stars with masses randomly distributed between
-            # m_low and m_up and store them in the dist_mass list.
-            dist_mass.extend(np.random.uniform(m_low, m_up, int(round(N_st))))
-            # Reset parameters and move on to the next interval.
-            N_st_add, m_low = 0., m_up
+    # Generate the masses for all the stars.
+    dist_mass = np.interp(np.random.uniform(0., N_cum[-1], N_total), N_cum,
+                          m_edges)
 
     return dist_mass
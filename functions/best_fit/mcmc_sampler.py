@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Ensemble MCMC sampler for the best fit process.
+"""
+
+import numpy as np
+from os.path import isfile
+from .._in import get_in_params as g
+from brute_force_algorithm import grid_key
+import parallel_eval as p_e
+
+
+def walker_models(pos, param_values):
+    '''
+    Models for the walkers' positions. Positions are given in units of the
+    parameters' indexes, each one is assigned the closest value in the grid.
+    '''
+    indx = np.rint(pos).astype(int)
+    models = [tuple(p_v[j] for p_v, j in zip(*[param_values, idx])) for idx
+              in indx]
+
+    return models
+
+
+def log_post(pos, param_values, pool):
+    '''
+    Log posterior (up to a constant) and likelihood for each walker. The prior
+    is flat inside the grid of parameter values. Walkers outside of it are
+    not evaluated.
+    '''
+    grid_shape = np.array([len(_) for _ in param_values])
+    inside = ((pos >= -0.5) & (pos < grid_shape - 0.5)).all(axis=1)
+    lkl = np.full(len(pos), np.inf)
+    lkl[inside] = p_e.eval_models(walker_models(pos[inside], param_values),
+                                  pool)
+    # The 'mighell' method returns a chi-square value. The other methods
+    # return minus the logarithm of the likelihood.
+    if g.bf_params[2] == 'mighell':
+        lp = -0.5 * lkl
+    else:
+        lp = -lkl
+
+    return lp, lkl
+
+
+def mcmc(flag_print_perc, err_lst, obs_clust, completeness, ip_list,
+         st_dist_mass, bf_file):
+    '''
+    Ensemble MCMC sampler using the affine invariant stretch move of Goodman
+    & Weare (2010), as implemented in Foreman-Mackey et al. (2013): the
+    walkers are split in two halves and each half is moved (and evaluated)
+    at once, using the positions of the other half.
+
+    The chain (positions and log posterior of each walker at each step) is
+    stored in a .npy file as soon as each step is processed, so an
+    interrupted run is resumed from the last step completed.
+
+    Returns the same values as the GA. The models and likelihoods stored in
+    'model_done' are the samples of the chain after the burn-in steps.
+    '''
+
+    param_values = ip_list[1]
+    grid_shape = tuple(len(_) for _ in param_values)
+    n_walk, n_steps, n_burn, a = g.mm_params
+
+    # File that stores the chain, one row per step. The last column holds
+    # the log posterior, NaN for steps not yet processed.
+    key = grid_key(err_lst, obs_clust, completeness, param_values)
+    chain_file = bf_file + '_mcmc_' + key + '_{}.npy'.format(n_walk)
+    if isfile(chain_file):
+        chain = np.load(chain_file, mmap_mode='r+')
+    if not isfile(chain_file) or chain.shape[0] != n_steps:
+        chain = np.lib.format.open_memmap(
+            chain_file, mode='w+', dtype=float,
+            shape=(n_steps, n_walk, len(grid_shape) + 1))
+        chain[:] = np.nan
+        chain.flush()
+
+    # Store the data needed to evaluate the models and start the pool of
+    # processes, if more than one was selected.
+    pool = p_e.start_pool(err_lst, obs_clust, completeness, st_dist_mass,
+                          ip_list)
+
+    try:
+        # Steps already processed.
+        i0 = int((~np.isnan(chain[:, 0, -1])).sum())
+        if i0 > 0:
+            print ' Resuming from {} steps processed.'.format(i0)
+            pos, lp = np.array(chain[i0 - 1, :, :-1]), \
+                np.array(chain[i0 - 1, :, -1])
+            lkl = (-2. if g.bf_params[2] == 'mighell' else -1.) * lp
+        else:
+            # Initial positions spread uniformly over the grid.
+            pos = np.random.uniform(-0.5, np.asarray(grid_shape) - 0.5,
+                                    (n_walk, len(grid_shape)))
+            lp, lkl = log_post(pos, param_values, pool)
+
+        # For plotting purposes.
+        lkl_old, new_bs_indx = [[], []], []
+        best_lkl = np.inf
+
+        halves = [np.arange(0, n_walk // 2), np.arange(n_walk // 2, n_walk)]
+        milestones = [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]
+        for i in range(i0, n_steps):
+
+            for k in (0, 1):
+                s, c = halves[k], halves[1 - k]
+                # Stretch move for the walkers in this half, each one using a
+                # random walker of the complementary half.
+                z = np.square((a - 1.) * np.random.uniform(0., 1., len(s)) +
+                              1.) / a
+                partner = pos[c[np.random.randint(0, len(c), len(s))]]
+                pos_new = partner + z[:, None] * (pos[s] - partner)
+                lp_new, lkl_new = log_post(pos_new, param_values, pool)
+                # Accept or reject the proposed positions. The walkers are
+                # stretched along all the dimensions of the grid, including
+                # those of parameters with a single value.
+                log_acc = (len(grid_shape) - 1.) * np.log(z) + lp_new - lp[s]
+                accept = np.log(np.random.uniform(0., 1., len(s))) < log_acc
+                pos[s[accept]] = pos_new[accept]
+                lp[s[accept]], lkl[s[accept]] = lp_new[accept], lkl_new[accept]
+
+            # Store this step.
+            chain[i, :, :-1], chain[i, :, -1] = pos, lp
+            chain.flush()
+
+            # For plotting purposes.
+            if lkl.min() < best_lkl:
+                best_lkl = lkl.min()
+                new_bs_indx.append([i - i0])
+            lkl_old[0].append(best_lkl)
+            # Discard large values associated with empty arrays from mean.
+            lkl_valid = lkl[lkl < 9.9e08]
+            lkl_old[1].append(np.mean(lkl_valid) if lkl_valid.size else
+                              best_lkl)
+
+            if flag_print_perc:
+                percentage_complete = (100.0 * (i + 1) / n_steps)
+                while len(milestones) > 0 and \
+                        percentage_complete >= milestones[0]:
+                    print (" {:>3}% done  L={:.1f}".format(milestones[0],
+                                                           best_lkl))
+                    # Remove that milestone from the list.
+                    milestones = milestones[1:]
+    except:
+        # Do not wait for the workers if the process failed or was
+        # interrupted.
+        p_e.stop_pool(pool, terminate=True)
+        raise
+    p_e.stop_pool(pool)
+
+    # Samples of the chain after the burn-in steps.
+    samples = np.array(chain[n_burn:]).reshape(
+        -1, len(grid_shape) + 1)
+    lkl_samples = (-2. if g.bf_params[2] == 'mighell' else -1.) * \
+        samples[:, -1]
+    model_done = [walker_models(samples[:, :-1], param_values),
+                  list(lkl_samples)]
+
+    # The best fit is the sample with the largest posterior.
+    isoch_fit_params = [model_done[0][np.argmin(lkl_samples)], lkl_old,
+                        new_bs_indx, model_done]
+
+    return isoch_fit_params
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded least recently used cache for synthetic cluster models.
+"""
+
+from collections import OrderedDict
+
+
+def new_cache(max_size):
+    '''
+    Return an empty cache of evaluated models (or of any other value that
+    depends on the parameters of a model). If 'max_size' is larger than
+    zero, the least recently used models are removed once that many models
+    are stored.
+    '''
+    cache = {'models': OrderedDict(), 'max_size': max_size, 'hits': 0,
+             'misses': 0}
+
+    return cache
+
+
+def model_key(model):
+    '''
+    Key used to identify a model in the cache. Parameter values are rounded
+    so that tiny floating point differences do not produce different keys.
+    '''
+    return tuple(round(float(_), 8) for _ in model)
+
+
+def cache_get(cache, model):
+    '''
+    Return the stored [likelihood (or value), number of evaluations] for this
+    model, or None if it is not in the cache. Updates the hit/miss counters.
+    '''
+    key = model_key(model)
+    models = cache['models']
+    try:
+        # Re-insert so the model is flagged as the most recently used.
+        entry = models.pop(key)
+        models[key] = entry
+        cache['hits'] += 1
+    except KeyError:
+        entry = None
+        cache['misses'] += 1
+
+    return entry
+
+
+def cache_store(cache, model, likelihood, n_eval=1):
+    '''
+    Store (or replace) the likelihood (or value) of a model in the cache,
+    removing the least recently used models if the size limit is exceeded.
+    '''
+    key = model_key(model)
+    models = cache['models']
+    models.pop(key, None)
+    models[key] = [likelihood, n_eval]
+
+    if cache['max_size'] > 0:
+        while len(models) > cache['max_size']:
+            models.popitem(last=False)
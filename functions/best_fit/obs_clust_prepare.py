@@ -19,21 +19,17 @@ def prepare(memb_prob_avrg_sort):
 
     if lkl_method == 'tolstoy':
 
-        # Remove IDs and re-pack converted to array.
-        obs_cl = np.array(zip(*zip(*memb_prob_avrg_sort)[1:]), dtype=float)
-
-        # Square errors and separate membership probabilities. Done here so
-        # as to not repeat the same calculations each time a new synthetic
-        # cluster is checked.
-        P = np.split(obs_cl, 7, axis=1)
+        # Remove IDs and store each column as a row of the array.
+        P = np.array(zip(*memb_prob_avrg_sort)[1:], dtype=float)
 
         # Square errors in color and magnitude. Store membership probabilities
-        # separately.
-        P[3], P[5], mem_probs = np.square(P[3]), np.square(P[5]), \
-            np.asarray(P[6])
+        # separately. Done here so as to not repeat the same calculations
+        # each time a new synthetic cluster is checked.
+        mag, e_mag, col, e_col, mem_probs = P[2:7]
+        obs_st = np.array([mag, np.square(e_mag), col, np.square(e_col)])
 
         # Pass observed cluster data.
-        obs_clust = [np.hstack(P), mem_probs]
+        obs_clust = [obs_st, mem_probs]
 
     else:
 
@@ -51,10 +47,19 @@ def prepare(memb_prob_avrg_sort):
         cl_histo = np.histogramdd(
             cl_mags_cols, bins=bin_edges, weights=np.asarray(P[6]))[0]
 
+        # Flattened histogram, used by the likelihood functions to compare
+        # with the synthetic clusters' histograms (binned the same way).
+        cl_histo_f = cl_histo.ravel()
+        # Indexes of the cells that contain observed stars, and their
+        # weights.
+        cl_cells = np.flatnonzero(cl_histo_f)
+        cl_weights = cl_histo_f[cl_cells]
+
         # Pass observed cluster data.
-        obs_clust = [cl_histo, bin_edges]
+        obs_clust = [cl_histo, bin_edges, cl_histo_f, cl_cells, cl_weights]
 
         # # Pass this list instead if plotting in get_likelihood.
-        # obs_clust = [cl_histo, bin_edges, mag_col_cl]
+        # obs_clust = [cl_histo, bin_edges, cl_histo_f, cl_cells, cl_weights,
+        #              mag_col_cl]
 
     return obs_clust
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluate batches of models in a pool of processes.
+"""
+
+import random
+import numpy as np
+from multiprocessing import Pool, cpu_count
+from .._in import get_in_params as g
+from .._in.get_isoch_params import isoch_indexes, get_isoch
+from get_likelihood import isoch_likelihood as i_l
+import synth_cluster as s_c
+
+
+# Data needed to evaluate any model: errors, prepared observed cluster,
+# completeness, IMF mass distribution and isochrones. It is set once per
+# process, so only parameter values (and seeds) are sent to the workers
+# for each model.
+shared = {}
+
+# Maximum number of models that share an isochrone, evaluated in a single
+# batch (with the isochrone obtained once, and a single seed).
+N_batch = 50
+
+
+def init_data(err_lst, obs_clust, completeness, st_dist_mass, ip_list):
+    '''
+    Store the data that does not change between models. Used as the
+    initializer of each worker process.
+    '''
+    shared['err_lst'], shared['obs_clust'] = err_lst, obs_clust
+    shared['completeness'], shared['st_dist_mass'] = completeness, \
+        st_dist_mass
+    shared['isoch_grid'], shared['param_values'] = ip_list
+    # Views of the isochrones in the grid (no data is copied), created once
+    # so the same object is always used for each (metallicity, age) value.
+    # The provider of lazy loaded isochrones is used as is.
+    if isinstance(ip_list[0], dict):
+        shared['isoch_list'] = ip_list[0]
+    else:
+        shared['isoch_list'] = [list(_) for _ in ip_list[0]]
+    shared['isoch_indx'] = isoch_indexes(ip_list[1])
+    # Size the caches of isochrones for this grid.
+    s_c.size_isoch_caches(ip_list[1])
+
+
+def num_proc():
+    '''
+    Number of processes to use, as set in the input parameters file.
+    '''
+    n_proc = g.pp_params[0]
+    if n_proc == 'max':
+        n_proc = cpu_count()
+
+    return n_proc
+
+
+def start_pool(err_lst, obs_clust, completeness, st_dist_mass, ip_list):
+    '''
+    Store the shared data in this process and, if more than one process was
+    selected, start the pool of workers that will evaluate the models.
+    Returns None if the models are to be evaluated serially.
+    '''
+    init_data(err_lst, obs_clust, completeness, st_dist_mass, ip_list)
+
+    pool, n_proc = None, num_proc()
+    if n_proc > 1:
+        pool = Pool(n_proc, initializer=init_data, initargs=(
+            err_lst, obs_clust, completeness, st_dist_mass, ip_list))
+
+    return pool
+
+
+def stop_pool(pool, terminate=False):
+    '''
+    Close the pool of workers, if one was started. If 'terminate' is True
+    the workers are stopped without completing the pending tasks.
+    '''
+    if pool is not None:
+        if terminate:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+
+
+def eval_batch(batch_seed):
+    '''
+    Evaluate the likelihoods of a batch of models that share the same
+    isochrone, with the random generators seeded with the value given for
+    the batch.
+    '''
+    batch, seed = batch_seed
+    np.random.seed(seed)
+    random.seed(seed)
+    s_c.reset_normal_dev()
+
+    # Metallicity and age indexes to identify isochrone.
+    m_indx, a_indx = shared['isoch_indx']
+    m_i, a_i = m_indx[batch[0][0]], a_indx[batch[0][1]]
+    isochrone = get_isoch(shared['isoch_list'], m_i, a_i)
+
+    likel_lst = [i_l(shared['err_lst'], shared['obs_clust'],
+                     shared['completeness'], shared['st_dist_mass'], isochrone,
+                     model) for model in batch]
+
+    return likel_lst
+
+
+def isoch_batches(models):
+    '''
+    Group the models that share the same isochrone (metallicity and age) in
+    batches of at most 'N_batch' models. Returns the batches and the indexes
+    of their models in the original list.
+    '''
+    groups = {}
+    for i, model in enumerate(models):
+        groups.setdefault((model[0], model[1]), []).append(i)
+
+    batches, indexes = [], []
+    # Sort by the position of the first model in each group, so the batches
+    # are always generated in the same order for the same list of models.
+    for idx in sorted(groups.values()):
+        for j in range(0, len(idx), N_batch):
+            indexes.append(idx[j:j + N_batch])
+            batches.append([models[_] for _ in indexes[-1]])
+
+    return batches, indexes
+
+
+def eval_models(models, pool=None):
+    '''
+    Evaluate a list of models and return their likelihoods, in the same
+    order.
+
+    Models that share an isochrone are evaluated in batches. Each batch gets
+    its own seed drawn from the main process' generator, so the results do
+    not depend on the number of processes used.
+    '''
+    batches, indexes = isoch_batches(models)
+    seeds = np.random.randint(0, 2 ** 31 - 1, len(batches))
+    jobs = zip(*[batches, seeds])
+
+    if pool is None:
+        # Store the state of the generators so that the seeding done for
+        # each batch does not affect the caller.
+        np_state, py_state = np.random.get_state(), random.getstate()
+        likel_batches = map(eval_batch, jobs)
+        np.random.set_state(np_state)
+        random.setstate(py_state)
+    else:
+        # Send a few chunks of batches to each process.
+        chunksize = max(1, len(jobs) // (4 * num_proc()))
+        likel_batches = pool.map(eval_batch, jobs, chunksize)
+
+    # Return the likelihoods in the order of the models.
+    likel_lst = [0.] * len(models)
+    for idx, likel_batch in zip(*[indexes, likel_batches]):
+        for i, likel in zip(*[idx, likel_batch]):
+            likel_lst[i] = likel
+
+    return likel_lst
+
+
+def eval_chunk(chunk):
+    '''
+    Evaluate all the models in a chunk of the flattened grid of parameter
+    values. Only the limits of the chunk and its seed are sent to the
+    workers; the models are generated here from the grid.
+    '''
+    i0, i1, seed = chunk
+    np.random.seed(seed)
+    random.seed(seed)
+    s_c.reset_normal_dev()
+
+    isoch_list, param_values = shared['isoch_list'], shared['param_values']
+    # Grid indexes for each parameter, for all the models in the chunk.
+    grid_idx = np.unravel_index(np.arange(i0, i1),
+                                [len(_) for _ in param_values])
+
+    models = [[p_v[i] for p_v, i in zip(*[param_values, idx])] for idx in
+              zip(*grid_idx)]
+
+    # The grid is flattened with the metallicity and age as the slowest
+    # varying parameters, so the models that share an isochrone are
+    # consecutive. The isochrone is obtained once for each run of these
+    # models.
+    likel_chunk = np.empty(i1 - i0)
+    j0 = 0
+    while j0 < len(models):
+        m_i, a_i = grid_idx[0][j0], grid_idx[1][j0]
+        j1 = j0 + 1
+        while j1 < len(models) and grid_idx[0][j1] == m_i and \
+                grid_idx[1][j1] == a_i:
+            j1 += 1
+        isochrone = get_isoch(isoch_list, m_i, a_i)
+        for j in range(j0, j1):
+            likel_chunk[j] = i_l(
+                shared['err_lst'], shared['obs_clust'], shared['completeness'],
+                shared['st_dist_mass'], isochrone, models[j])
+        j0 = j1
+
+    return i0, likel_chunk
+
+
+def eval_chunks(chunks, pool=None):
+    '''
+    Evaluate chunks of the grid of parameter values. Yields the results
+    for each chunk as soon as they are available, not necessarily in the
+    same order the chunks were given.
+    '''
+    if pool is None:
+        # Store the state of the generators so that the seeding done for
+        # each chunk does not affect the caller.
+        np_state, py_state = np.random.get_state(), random.getstate()
+        try:
+            for chunk in chunks:
+                yield eval_chunk(chunk)
+        finally:
+            np.random.set_state(np_state)
+            random.setstate(py_state)
+    else:
+        for result in pool.imap_unordered(eval_chunk, chunks):
+            yield result
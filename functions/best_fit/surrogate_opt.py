@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Surrogate model optimizer for the best fit process.
+"""
+
+import numpy as np
+from scipy.stats import norm
+from .._in import get_in_params as g
+import parallel_eval as p_e
+
+
+def grid_coords(indx, grid_shape):
+    '''
+    Map the grid indexes of the models into the [0, 1] range for each
+    parameter. Parameters with a single value are mapped to 0.
+    '''
+    return indx / np.maximum(np.asarray(grid_shape, dtype=float) - 1., 1.)
+
+
+def random_indexes(grid_shape, N):
+    '''
+    Grid indexes for N random models.
+    '''
+    return np.array([np.random.randint(0, n, N) for n in grid_shape]).T
+
+
+def neighbours(indx, grid_shape, N):
+    '''
+    Grid indexes for N random models located close to the ones given, moving
+    up to 3 steps in each parameter.
+    '''
+    base = indx[np.random.randint(0, len(indx), N)]
+    step = np.random.randint(-3, 4, base.shape)
+    return np.clip(base + step, 0, np.asarray(grid_shape) - 1)
+
+
+def gp_fit(X, y):
+    '''
+    Fit a Gaussian process with a squared exponential kernel to the points X
+    with values y. The length scale and the noise (the likelihood of a model
+    changes each time it is evaluated) are selected by maximizing the
+    marginal likelihood over a small grid of values.
+
+    Returns the data needed by 'gp_predict'.
+    '''
+    sq_dist = np.square(X[:, None, :] - X[None, :, :]).sum(axis=2)
+    y_mean, y_std = y.mean(), max(y.std(), 1e-10)
+    y_n = (y - y_mean) / y_std
+
+    best = None
+    for l_scale in (0.05, 0.1, 0.2, 0.4):
+        K0 = np.exp(-0.5 * sq_dist / l_scale ** 2)
+        for noise in (1e-3, 1e-2, 1e-1):
+            try:
+                L = np.linalg.cholesky(K0 + noise * np.eye(len(y)))
+            except np.linalg.LinAlgError:
+                continue
+            alpha = np.linalg.solve(L.T, np.linalg.solve(L, y_n))
+            # Log marginal likelihood, minus the constant term.
+            log_ml = -0.5 * y_n.dot(alpha) - np.log(np.diag(L)).sum()
+            if best is None or log_ml > best[0]:
+                best = [log_ml, l_scale, L, alpha]
+
+    gp = [X, y_mean, y_std] + best[1:]
+
+    return gp
+
+
+def gp_predict(gp, X_new):
+    '''
+    Mean and standard deviation predicted by the Gaussian process for the
+    points X_new.
+    '''
+    X, y_mean, y_std, l_scale, L, alpha = gp
+    sq_dist = np.square(X_new[:, None, :] - X[None, :, :]).sum(axis=2)
+    K_s = np.exp(-0.5 * sq_dist / l_scale ** 2)
+    mu = K_s.dot(alpha)
+    v = np.linalg.solve(L, K_s.T)
+    sigma = np.sqrt(np.maximum(1. - np.square(v).sum(axis=0), 1e-12))
+
+    return y_mean + mu * y_std, sigma * y_std
+
+
+def expected_improv(mu, sigma, y_best):
+    '''
+    Expected improvement (for a minimization) of each candidate over the best
+    value found.
+    '''
+    imp = y_best - mu
+    z = imp / sigma
+    return imp * norm.cdf(z) + sigma * norm.pdf(z)
+
+
+def surrog_opt(flag_print_perc, err_lst, obs_clust, completeness, ip_list,
+               st_dist_mass):
+    '''
+    Surrogate model optimizer. A Gaussian process is fitted to the
+    likelihoods of the models evaluated so far and used to select, by their
+    expected improvement, the next models to evaluate.
+
+    Returns the same values as the GA, with each batch of models evaluated
+    taking the place of a generation.
+    '''
+
+    param_values = ip_list[1]
+    grid_shape = tuple(len(_) for _ in param_values)
+    n_init, n_batch, n_max = g.so_params
+    # Number of candidates checked in each iteration, and maximum number of
+    # models used to fit the Gaussian process (the best ones).
+    n_cand, n_train = 2000, 500
+
+    # Store the data needed to evaluate the models and start the pool of
+    # processes, if more than one was selected.
+    pool = p_e.start_pool(err_lst, obs_clust, completeness, st_dist_mass,
+                          ip_list)
+    try:
+
+        # Grid indexes and likelihoods of the models evaluated.
+        indx_done, lkl_done = np.empty((0, len(grid_shape)), dtype=int), \
+            np.empty(0)
+        # Stores parameters of the solutions already processed and the
+        # likelihoods obtained.
+        model_done = [[], []]
+        # For plotting purposes.
+        lkl_old, new_bs_indx = [[], []], []
+
+        # Start with random models.
+        new_indx = random_indexes(grid_shape, n_init)
+
+        i, milestones = 0, [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]
+        while len(new_indx) > 0:
+
+            # Evaluate the new models.
+            models = [tuple(p_v[j] for p_v, j in zip(*[param_values, idx])) for
+                      idx in new_indx]
+            likel_new = np.array(p_e.eval_models(models, pool))
+            model_done[0].extend(models)
+            model_done[1].extend(likel_new)
+
+            best_old = lkl_done.min() if len(lkl_done) else np.inf
+            indx_done = np.concatenate([indx_done, new_indx])
+            lkl_done = np.concatenate([lkl_done, likel_new])
+
+            # For plotting purposes.
+            if lkl_done.min() < best_old:
+                new_bs_indx.append([i])
+            lkl_old[0].append(lkl_done.min())
+            # Discard large values associated with empty arrays from mean.
+            lkl_valid = likel_new[likel_new < 9.9e08]
+            lkl_old[1].append(np.mean(lkl_valid) if len(lkl_valid) else
+                              lkl_done.min())
+
+            if flag_print_perc:
+                best = np.argmin(lkl_done)
+                percentage_complete = (100.0 * len(lkl_done) / n_max)
+                while len(milestones) > 0 and \
+                        percentage_complete >= milestones[0]:
+                    print (" {:>3}% done  L={:.1f} ({:g}, {:g}, {:g}, {:g},"
+                           " {:g}, {:g})".format(milestones[0],
+                                                 lkl_done[best],
+                                                 *model_done[0][best]))
+                    # Remove that milestone from the list.
+                    milestones = milestones[1:]
+
+            n_new = min(n_batch, n_max - len(lkl_done))
+            if n_new <= 0:
+                break
+
+            # Fit the surrogate to the best models evaluated. Large values
+            # associated with empty synthetic clusters are replaced by the
+            # largest valid value.
+            train = np.argsort(lkl_done, kind='mergesort')[:n_train]
+            y = lkl_done[train]
+            valid = y < 9.9e08
+            if valid.any():
+                y = np.where(valid, y, y[valid].max())
+            gp = gp_fit(grid_coords(indx_done[train], grid_shape), y)
+
+            # Candidates: random models and models close to the best ones, not
+            # evaluated before.
+            cand = np.concatenate([
+                random_indexes(grid_shape, n_cand // 2),
+                neighbours(indx_done[train[:10]], grid_shape, n_cand // 2)])
+            flat_done = set(np.ravel_multi_index(indx_done.T, grid_shape))
+            flat_cand, first = np.unique(
+                np.ravel_multi_index(cand.T, grid_shape), return_index=True)
+            cand = cand[first[[_ not in flat_done for _ in flat_cand]]]
+
+            # Select the candidates with the largest expected improvement.
+            mu, sigma = gp_predict(gp, grid_coords(cand, grid_shape))
+            ei = expected_improv(mu, sigma, y.min())
+            new_indx = cand[np.argsort(-ei, kind='mergesort')[:n_new]]
+            i += 1
+    except:
+        # Do not wait for the workers if the process failed or was
+        # interrupted.
+        p_e.stop_pool(pool, terminate=True)
+        raise
+    p_e.stop_pool(pool)
+
+    isoch_fit_params = [model_done[0][np.argmin(lkl_done)], lkl_old,
+                        new_bs_indx, model_done]
+
+    return isoch_fit_params
@@ -45,6 +45,22 @@ def get_m_c_errors(mag, mag_value, e_mc_v):
     return popt_mc
 
 
+def err_table(mag, popt_mag, popt_col, m_step=0.001):
+    '''
+    Tabulate the magnitude and color errors given by the fitted exponential
+    curves on a fine grid of magnitude values, limited to e_max. The range
+    goes 10 mag below the brightest star up to the faintest one, which is
+    also the faintest magnitude a synthetic star can have.
+    '''
+    e_max = g.er_params[1]
+
+    mag_grid = np.arange(min(mag) - 10., max(mag) + 2 * m_step, m_step)
+    e_mag_grid = np.minimum(ef.exp_3p(mag_grid, *popt_mag), e_max)
+    e_col_grid = np.minimum(ef.exp_3p(mag_grid, *popt_col), e_max)
+
+    return [mag_grid, e_mag_grid, e_col_grid]
+
+
 def synth_clust_err(phot_data, err_pck):
     '''
     Generate exponential error function parameters to feed the synthetic
@@ -70,4 +86,8 @@ def synth_clust_err(phot_data, err_pck):
         popt_mc = get_m_c_errors(mag, mag_value, e_col_v)
         err_lst.append(popt_mc)
 
+    # Store the errors tabulated for these curves, used by the synthetic
+    # cluster generation function.
+    err_lst.append(err_table(mag, *err_lst))
+
     return err_lst
\ No newline at end of file
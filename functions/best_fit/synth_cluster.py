@@ -6,12 +6,10 @@ Created on Tue Jan 28 15:22:10 2014
 """
 
 import numpy as np
-import random
-import itertools
 from .._in import get_in_params as g
-from functions.exp_function import exp_3p
 from move_isochrone import move_isoch
 from get_mass_dist import mass_dist as m_d
+import models_cache as m_c
 
 #############################################################
 # # Timer function: http://stackoverflow.com/a/21860100/1391441
@@ -30,12 +28,45 @@ from get_mass_dist import mass_dist as m_d
 #############################################################
 
 
+# Buffer of normal deviates, used sequentially by the gauss_error function
+# and refilled when exhausted.
+normal_buff = {'vals': np.empty(0), 'i': 0}
+
+
+def reset_normal_dev():
+    '''
+    Discard the deviates left in the buffer, so the next ones are drawn from
+    the current state of the random generator.
+    '''
+    normal_buff['vals'], normal_buff['i'] = np.empty(0), 0
+
+
+def normal_dev(N, N_buff=2 ** 16):
+    '''
+    Return N deviates from a standard normal distribution, taken from the
+    buffer.
+
+    After a reset the buffer is refilled with only the N deviates requested.
+    Each following refill doubles its size (up to N_buff deviates, or N if
+    larger), so a batch that needs few deviates does not draw many more.
+    '''
+    i = normal_buff['i']
+    if i + N > len(normal_buff['vals']):
+        N_new = max(N, min(2 * len(normal_buff['vals']), N_buff))
+        normal_buff['vals'], i = np.random.normal(0., 1., N_new), 0
+    normal_buff['i'] = i + N
+
+    return normal_buff['vals'][i:i + N]
+
+
 def gauss_error(col, e_col, mag, e_mag):
     '''
     Randomly move mag and color through a Gaussian function.
     '''
-    col_gauss = col + np.random.normal(0, 1, len(col)) * e_col
-    mag_gauss = mag + np.random.normal(0, 1, len(col)) * e_mag
+    # Deviates for the colors and magnitudes, taken at once.
+    dev = normal_dev(2 * len(col))
+    col_gauss = col + dev[:len(col)] * e_col
+    mag_gauss = mag + dev[len(col):] * e_mag
 
     return col_gauss, mag_gauss
 
@@ -45,14 +76,15 @@ def add_errors(isoch_compl, err_lst):
     Randomly move stars according to given error distributions.
     '''
 
-    e_max = g.er_params[1]
-
-    popt_mag, popt_col = err_lst
-    sigma_mag = np.array(exp_3p(isoch_compl[1], *popt_mag))
-    sigma_col = np.array(exp_3p(isoch_compl[1], *popt_col))
-    # Replace all error values greater than e_max with e_max.
-    sigma_mag[sigma_mag > e_max] = e_max
-    sigma_col[sigma_col > e_max] = e_max
+    # Take the errors from the values tabulated for the fitted exponential
+    # curves (already limited to e_max), at the closest point in the evenly
+    # spaced grid of magnitudes. Magnitudes outside the grid get the values
+    # at its limits.
+    mag_grid, e_mag_grid, e_col_grid = err_lst[2]
+    indx = ((isoch_compl[1] - mag_grid[0]) / (mag_grid[1] - mag_grid[0]) +
+            0.5).astype(int)
+    sigma_mag = e_mag_grid.take(indx, mode='clip')
+    sigma_col = e_col_grid.take(indx, mode='clip')
 
     ###################################################################
     # # Generate errors that depend only on the theoretical isochrone.
@@ -77,52 +109,40 @@ def compl_func(isoch_binar, completeness):
     Remove a number of stars according to the percentages of star loss find in
     get_completeness for the real observation.
     '''
+    # completeness[1] = bin_edges of the observed region histogram. Only the
+    # bins starting from the one with the maximum number of stars are used.
+    bin_edges = completeness[1][completeness[2]:]
+
     # If stars exist in the isochrone beyond the completeness magnitude
     # level, then apply the removal of stars. Otherwise, skip it.
-    if max(isoch_binar[1]) > completeness[1][completeness[2]]:
-
-        # Get histogram. completeness[1] = bin_edges of the observed
-        # region histogram.
-        synth_mag_hist, bin_edges = np.histogram(isoch_binar[1],
-                                                 completeness[1])
-        pi = completeness[3]
-        n1, p1 = synth_mag_hist[completeness[2]], pi[0]
-        di = np.around((synth_mag_hist[completeness[2]:] -
-                        (n1 / p1) * np.asarray(pi)), 0)
-
-        # Store indexes of *all* elements in isoch_m_d whose magnitude
-        # value falls between the ranges given.
-        c_indx = np.searchsorted(completeness[1][completeness[2]:],
-                                 isoch_binar[1], side='left')
-        N = len(completeness[1][completeness[2]:])
-        mask = (c_indx > 0) & (c_indx < N)
-        elements = c_indx[mask]
-        indices = np.arange(c_indx.size)[mask]
-        sorting_idx = np.argsort(elements, kind='mergesort')
-        ind_sorted = indices[sorting_idx]
-        x = np.searchsorted(elements, range(N), side='right',
-                            sorter=sorting_idx)
-        # Indexes.
-        rang_indx = [ind_sorted[x[i]:x[i + 1]] for i in range(N - 1)]
-
-        # Pick a number (given by the list 'di') of random elements in
-        # each range. Those are the indexes of the elements that
-        # should be removed from the three sub-lists.
-        rem_indx = []
-        for indx, num in enumerate(di):
-            if rang_indx[indx].any() and len(rang_indx[indx]) >= num:
-                rem_indx.append(np.random.choice(rang_indx[indx],
-                                int(num), replace=False))
-            else:
-                rem_indx.append(rang_indx[indx])
-
-        # Remove items from list.
-        # itertools.chain() flattens the list of indexes and sorted()
-        # with reverse=True inverts them so we don't change the
-        # indexes of the elements in the lists after removing them.
-        d_i = sorted(list(itertools.chain(*rem_indx)), reverse=True)
-        # Remove those selected indexes from the three sub-lists.
-        isoch_compl = np.delete(np.asarray(isoch_binar), d_i, axis=1)
+    if isoch_binar[1].max() > bin_edges[0]:
+
+        # Index of the magnitude bin for each star, plus one. Stars brighter
+        # than the first edge get 0 and those beyond the last edge get N.
+        c_indx = np.searchsorted(bin_edges, isoch_binar[1], side='left')
+        N = len(bin_edges)
+
+        # Number of synthetic stars in each bin.
+        in_range = (c_indx > 0) & (c_indx < N)
+        synth_mag_hist = np.bincount(c_indx[in_range] - 1, minlength=N - 1)
+
+        # Number of stars that should be kept in each bin, so the synthetic
+        # cluster follows the same percentages as the observed one, given
+        # the number of stars in the first bin.
+        pi = np.asarray(completeness[3])
+        n1, p1 = synth_mag_hist[0], pi[0]
+        n_keep = (n1 / p1) * pi
+
+        # Probability of keeping a star in each bin. Bins with fewer stars
+        # than those that should be kept lose none. Stars outside the bins
+        # are always kept.
+        p_keep = np.ones(N + 1)
+        p_keep[1:N] = np.minimum(
+            1., n_keep / np.maximum(synth_mag_hist, 1))
+
+        # Decide which stars are kept with a single random draw.
+        keep = np.random.uniform(0., 1., len(c_indx)) < p_keep[c_indx]
+        isoch_compl = np.asarray(isoch_binar)[:, keep]
     else:
         isoch_compl = np.asarray(isoch_binar)
 
@@ -197,50 +217,83 @@ def compl_func(isoch_binar, completeness):
 #     return isoch_compl
 
 
+def q_uniform(q_min, N):
+    '''
+    Mass ratios (secondary / primary) uniformly distributed between 'q_min'
+    and 1.
+    '''
+    return np.random.uniform(q_min, 1., N)
+
+
+def q_powerlaw(q_min, N):
+    '''
+    Mass ratios distributed between 'q_min' and 1 following a power-law,
+    f(q) ~ q^gamma. Obtained by inverting its cumulative distribution.
+    '''
+    gamma = g.sc_params[5]
+    u = np.random.uniform(0., 1., N)
+    if gamma == -1.:
+        q = q_min ** (1. - u)
+    else:
+        q_min_g = q_min ** (gamma + 1.)
+        q = (q_min_g + u * (1. - q_min_g)) ** (1. / (gamma + 1.))
+
+    return q
+
+
+# Distributions of mass ratios available for the binary systems.
+q_dists = {'uniform': q_uniform, 'powerlaw': q_powerlaw}
+
+
 def binarity(isoch_mass, isoch_cut, bin_frac):
     '''
     Randomly select a fraction of stars to be binaries.
     '''
 
-    bin_mass_ratio, cmd_sel = g.sc_params[2], g.ps_params[1]
+    bin_mass_ratio, q_dist = g.sc_params[2], g.sc_params[4]
+    cmd_sel = g.ps_params[1]
+
+    # Mask of the randomly selected stars in isoch_mass.
+    N_st = len(isoch_mass[0])
+    bin_mask = np.random.permutation(N_st) < int(bin_frac * N_st)
 
-    # Indexes of the randomly selected stars in isoch_m_d.
-    bin_indxs = random.sample(range(len(isoch_mass[0])),
-                              int(bin_frac * len(isoch_mass[0])))
+    if bin_mask.any():
 
-    # Calculate the secondary masses of these binary stars between
-    # bin_mass_ratio*m1 and m1, where m1 is the primary mass.
-    # Primary masses.
-    m1 = np.asarray(isoch_mass[2][bin_indxs])
-    # Secondary masses.
-    mass_bin0 = np.random.uniform(bin_mass_ratio * m1, m1)
-    # This prevents a rare error where apparently mass_bin0 is *not* a float.
-    if type(mass_bin0) is not float:
+        # Calculate the secondary masses of these binary stars between
+        # bin_mass_ratio*m1 and m1, where m1 is the primary mass, using the
+        # selected distribution of mass ratios.
+        # Primary masses.
+        m1 = isoch_mass[2][bin_mask]
+        # Secondary masses.
+        mass_bin0 = m1 * q_dists[q_dist](bin_mass_ratio, len(m1))
 
         # If any secondary mass falls outside of the lower isochrone's mass
         # range, change its value to the min value.
-        mass_bin = np.maximum(min(isoch_mass[2]), mass_bin0)
+        mass_bin = np.maximum(isoch_mass[2].min(), mass_bin0)
 
         # Find color and magnitude values for each secondary star. This will
         # slightly change the values of the masses since they will be
         # assigned to the closest value found in the interpolated isochrone.
         bin_isoch = mass_interp(isoch_cut, mass_bin)
 
+        # Color, magnitude and mass of the primary stars.
+        col_iso, mag_iso = isoch_mass[0][bin_mask], isoch_mass[1][bin_mask]
+
         # Obtain color, magnitude and masses for each binary system.
         # Transform color to the second magnitude before obtaining
         # the new binary magnitude.
         if cmd_sel in {2, 5, 9}:
             # E.g.: V vs (V-I)
-            mag2_iso = isoch_mass[1][bin_indxs] - isoch_mass[0][bin_indxs]
+            mag2_iso = mag_iso - col_iso
             mag2_bin = bin_isoch[1] - bin_isoch[0]
         else:
             # E.g.: V vs (B-V)
-            mag2_iso = isoch_mass[0][bin_indxs] + isoch_mass[1][bin_indxs]
+            mag2_iso = col_iso + mag_iso
             mag2_bin = bin_isoch[0] + bin_isoch[1]
         col_mag_bin = -2.5 * np.log10(10 ** (-0.4 * mag2_iso) +
                                       10 ** (-0.4 * mag2_bin))
         # Magnitude in y axis.
-        mag_bin = -2.5 * np.log10(10 ** (-0.4 * isoch_mass[1][bin_indxs]) +
+        mag_bin = -2.5 * np.log10(10 ** (-0.4 * mag_iso) +
                                   10 ** (-0.4 * bin_isoch[1]))
         # Transform back first filter's magnitude into color.
         if cmd_sel in {2, 5, 9}:
@@ -249,13 +302,10 @@ def binarity(isoch_mass, isoch_cut, bin_frac):
             col_bin = col_mag_bin - mag_bin
 
         # Add masses to obtain the system's mass.
-        mass_bin = isoch_mass[2][bin_indxs] + bin_isoch[2]
+        mass_bin = m1 + bin_isoch[2]
 
         # Update array with new values of color, magnitude and masses.
-        for indx, i in enumerate(bin_indxs):
-            isoch_mass[0][i] = col_bin[indx]
-            isoch_mass[1][i] = mag_bin[indx]
-            isoch_mass[2][i] = mass_bin[indx]
+        isoch_mass[:, bin_mask] = [col_bin, mag_bin, mass_bin]
 
     return isoch_mass
 
@@ -306,7 +356,7 @@ def mass_interp(isoch_cut, mass_dist):
 
     # Returns the indices that would sort the array (ie: the isochrone) with
     # the minimum mass (hence the '2') value first.
-    # From the isoch_cut_mag function, stars are ordered according to the
+    # From the moved_isoch_cut function, stars are ordered according to the
     # main magnitude from min to max.
     order = data[2, :].argsort()
 
@@ -361,23 +411,97 @@ def mass_interp(isoch_cut, mass_dist):
     return isoch_interp
 
 
-def isoch_cut_mag(isoch_moved, max_mag):
+def sort_isoch(isochrone):
+    '''
+    Sort isochrone according to magnitude values (min to max). Moving the
+    isochrone does not change this order, since all the magnitudes are
+    shifted by the same amount.
+    '''
+    isochrone = np.asarray(isochrone)
+    isoch_sort = isochrone[:, isochrone[1].argsort(kind='mergesort')]
+
+    return isoch_sort
+
+
+def cut_sorted(isoch_sort, max_mag):
     '''
-    Remove stars from isochrone with magnitude values larger that the maximum
-    value found in the observation (entire field, not just the cluster
-    region).
+    Remove stars from an isochrone already sorted by magnitude, with
+    magnitude values larger that the maximum value found in the observation
+    (entire field, not just the cluster region).
     '''
-    # Sort isochrone according to magnitude values (min to max).
-    # with timeblock(" cut1"):
-    isoch_sort = zip(*sorted(zip(*isoch_moved), key=lambda x: x[1]))
-    # Now remove values beyond max_mag (= completeness[0]).
+    mags = isoch_sort[1]
     # Get index of closest mag value to max_mag.
-    # with timeblock(" cut2"):
-    max_indx = min(range(len(isoch_sort[1])), key=lambda i:
-                   abs(isoch_sort[1][i] - max_mag))
+    i = np.searchsorted(mags, max_mag)
+    if i == len(mags) or (i > 0 and
+                          max_mag - mags[i - 1] <= mags[i] - max_mag):
+        i -= 1
+    # If this magnitude value is repeated, use the first one.
+    max_indx = np.searchsorted(mags, mags[i])
     # Discard elements beyond max_mag limit.
-    # with timeblock(" cut3"):
-    isoch_cut = np.array([isoch_sort[i][0:max_indx] for i in range(3)])
+    isoch_cut = isoch_sort[:, :max_indx]
+
+    return isoch_cut
+
+
+# Isochrones sorted by magnitude, stored by (metallicity, age) values. The
+# size is limited so that not all the isochrones of a large grid are kept in
+# memory when they are loaded only when needed.
+isochs_sort = m_c.new_cache(1000)
+# Moved and cut isochrones, stored by (metallicity, age, extinction, distance,
+# maximum magnitude) values.
+isochs_cut = m_c.new_cache(2000)
+
+
+def size_isoch_caches(param_values):
+    '''
+    Set the maximum number of isochrones stored in the caches of sorted and
+    of moved+cut isochrones: the number of (metallicity, age) and of
+    (metallicity, age, extinction, distance) values in the grid, limited to
+    the sizes selected in the input parameters (0 means no limit).
+    '''
+    N_ma = len(param_values[0]) * len(param_values[1])
+    N_maed = N_ma * len(param_values[2]) * len(param_values[3])
+    for cache, N, max_size in zip(*[[isochs_sort, isochs_cut], [N_ma, N_maed],
+                                    g.ic_params]):
+        cache['max_size'] = min(N, max_size) if max_size > 0 else N
+
+
+def moved_isoch_cut(isochrone, params, max_mag):
+    '''
+    Move the isochrone using the values 'e' and 'd' in 'params' and remove
+    stars beyond the magnitude cut.
+
+    The isochrone sorted by magnitude is obtained only once for each
+    (metallicity, age), and the moved+cut isochrones are stored for the last
+    (metallicity, age, e, d) values used. The stored arrays must not be
+    modified.
+    '''
+    m, a, e, d = params[:4]
+
+    # Isochrone sorted by magnitude. Store a reference to the original
+    # isochrone to make sure that it is the one stored for these (m, a)
+    # values.
+    entry = m_c.cache_get(isochs_sort, (m, a))
+    if entry is None or entry[0][0] is not isochrone:
+        entry = [[isochrone, sort_isoch(isochrone)]]
+        m_c.cache_store(isochs_sort, (m, a), entry[0])
+        # Moved isochrones stored for a previous isochrone with these
+        # (m, a) values are not valid.
+        m_a = m_c.model_key((m, a))
+        for k in [_ for _ in isochs_cut['models'] if _[:2] == m_a]:
+            del isochs_cut['models'][k]
+    isoch_sort = entry[0][1]
+
+    key = (m, a, e, d, max_mag)
+    entry = m_c.cache_get(isochs_cut, key)
+    if entry is None:
+        # Move theoretical isochrone using the values 'e' and 'd'.
+        isoch_moved = np.array(move_isoch([isoch_sort[0], isoch_sort[1]], e,
+                                          d) + [isoch_sort[2]])
+        isoch_cut = cut_sorted(isoch_moved, max_mag)
+        m_c.cache_store(isochs_cut, key, isoch_cut)
+    else:
+        isoch_cut = entry[0]
 
     return isoch_cut
 
@@ -391,11 +515,6 @@ def synth_clust(err_lst, completeness, st_dist, isochrone, params):
     # Unpack synthetic cluster parameters.
     e, d, M_total, bin_frac = params[2:]
 
-    # with timeblock("move"):
-    # Move theoretical isochrone using the values 'e' and 'd'.
-    isoch_moved = move_isoch([isochrone[0], isochrone[1]], e, d) +\
-        [isochrone[2]]
-
     ##############################################################
     # # To generate a synthetic cluster with the full isochrone length,
     # # un-comment this line.
@@ -406,9 +525,10 @@ def synth_clust(err_lst, completeness, st_dist, isochrone, params):
     # completeness[0] = max(isoch_moved[1]) + 0.5
     ##############################################################
 
-    # Get isochrone minus those stars beyond the magnitude cut.
-    # with timeblock("cut"):
-    isoch_cut = isoch_cut_mag(isoch_moved, completeness[0])
+    # Move theoretical isochrone using the values 'e' and 'd', and get it
+    # minus those stars beyond the magnitude cut.
+    # with timeblock("move+cut"):
+    isoch_cut = moved_isoch_cut(isochrone, params, completeness[0])
 
     # Empty array to pass if at some point no stars are left.
     synth_clust = np.asarray([])
@@ -283,7 +283,8 @@ def check(mypath, file_end, cl_files):
     if bf_flag:
 
         # Check best fit method selected.
-        if best_fit_algor not in {'brute', 'genet'}:
+        if best_fit_algor not in {'brute', 'genet', 'surrog',
+                                  'mcmc'}:
             sys.exit("ERROR: the selected best fit method '{}' does not match"
                      " a valid input.".format(best_fit_algor))
 
@@ -315,21 +316,93 @@ def check(mypath, file_end, cl_files):
                 sys.exit("ERROR: GA 'n_el' must be smaller than 'n_pop';\n"
                          "'{}' and '{}' are set respectively.".format(
                             n_el, n_pop))
+            # Encoding of the solutions.
+            if g.go_params[0] not in {'binary', 'integer'}:
+                sys.exit("ERROR: GA encoding is not a valid choice;\n"
+                         "'{}' is set.".format(g.go_params[0]))
+            if g.go_params[1] not in {'roulette', 'tournament'}:
+                sys.exit("ERROR: GA selection operator is not a valid "
+                         "choice;\n'{}' is set.".format(g.go_params[1]))
+            if g.go_params[1] == 'tournament' and \
+                    not 1 <= g.go_params[2] <= n_pop:
+                sys.exit("ERROR: GA 'n_tourn' must be in the range [1, "
+                         "n_pop];\n'{}' is set.".format(g.go_params[2]))
+            # Island model.
+            n_isl, n_mig = g.gi_params
+            if n_isl < 1 or n_mig < 1:
+                sys.exit("ERROR: GA number of islands and generations "
+                         "between\nmigrations must be greater than zero;"
+                         "\n'{}' and '{}' are set respectively.".format(
+                             n_isl, n_mig))
+            # Convergence monitor.
+            conv_flag, n_win, tol_lkl, tol_spr = g.gc_params
+            if conv_flag and (n_win < 1 or min(tol_lkl, tol_spr) < 0.):
+                sys.exit("ERROR: GA convergence monitor 'n_win' must be "
+                         "greater\nthan zero, and its tolerances can not be "
+                         "negative;\n{}, {} and {} are set.".format(
+                             n_win, tol_lkl, tol_spr))
+            # Bootstrap runs.
+            b_n_gen, b_n_ei, b_n_es = g.bs_params[1:]
+            if g.bs_params[0] and min(b_n_gen, b_n_ei, b_n_es) < 1:
+                sys.exit("ERROR: number must be greater than zero in the\n"
+                         "bootstrap GA parameters; {}, {} and {} are set.".
+                         format(b_n_gen, b_n_ei, b_n_es))
+            # Models cache.
+            mc_mode, mc_size = g.mc_params
+            if mc_mode not in {'min', 'mean', 'skip'}:
+                sys.exit("ERROR: GA models cache mode is not a valid choice;"
+                         "\n'{}' is set.".format(mc_mode))
+            if mc_size != 0 and mc_size <= n_pop:
+                sys.exit("ERROR: GA models cache size must be 0 or greater "
+                         "than\n'n_pop'; '{}' and '{}' are set respectively."
+                         .format(mc_size, n_pop))
+
+        if best_fit_algor == 'surrog':
+            # Check surrogate optimizer input params.
+            n_init, n_batch, n_max = g.so_params
+            if min(n_init, n_batch, n_max) < 1 or n_init > n_max:
+                sys.exit("ERROR: surrogate optimizer parameters must be "
+                         "greater\nthan zero, with 'n_init' not greater than "
+                         "'n_max';\n{}, {} and {} are set.".format(
+                             n_init, n_batch, n_max))
+
+        if best_fit_algor == 'mcmc':
+            # Check MCMC sampler input params.
+            n_walk, n_steps, n_burn, a = g.mm_params
+            if n_walk < 2 or n_walk % 2 != 0:
+                sys.exit("ERROR: the number of MCMC walkers must be an even"
+                         "\nnumber greater than zero; {} is set.".format(
+                             n_walk))
+            if n_steps < 1 or not 0 <= n_burn < n_steps:
+                sys.exit("ERROR: the number of MCMC steps must be greater "
+                         "than\nzero and larger than the number of burn-in "
+                         "steps;\n{} and {} are set respectively.".format(
+                             n_steps, n_burn))
+            if a <= 1.:
+                sys.exit("ERROR: the MCMC stretch move scale 'a' must be "
+                         "greater\nthan 1; {} is set.".format(a))
+
+        # Check number of processes.
+        n_proc = g.pp_params[0]
+        if n_proc != 'max' and (type(n_proc) is not int or n_proc < 1):
+            sys.exit("ERROR: the number of processes ('{}') must be an\n"
+                     "integer greater than zero, or 'max'.".format(n_proc))
 
         # Check likelihood method selected.
-        if lkl_method not in {'tolstoy', 'dolphin'}:
+        if lkl_method not in {'tolstoy', 'dolphin', 'mighell'}:
             sys.exit("ERROR: the selected likelihood method '{}' does not"
                      " match a valid input.".format(lkl_method))
 
         # Check binning method selected.
-        if lkl_method == 'dolphin' and bin_method not in bin_methods_dict:
+        if lkl_method in {'dolphin', 'mighell'} and \
+                bin_method not in bin_methods_dict:
             sys.exit("ERROR: the selected binning method '{}' for the 'Best"
                      "\nfit' function does not match a valid input."
                      .format(bin_method))
 
         # Unpack.
         iso_path = g.ps_params[0]
-        iso_select, par_ranges = g.ps_params[2:]
+        iso_select, isoch_dtype, par_ranges = g.ps_params[2:]
 
         # Check if /isochrones folder exists.
         if not isdir(iso_path):
@@ -337,6 +410,23 @@ def check(mypath, file_end, cl_files):
                      " run but the folder:\n\n {}\n\ndoes not exists."
                      .format(iso_path))
 
+        # Check precision of the stored isochrones.
+        if isoch_dtype not in {'float64', 'float32'}:
+            sys.exit("ERROR: the precision of the isochrones ('{}') must be"
+                     "\n'float64' or 'float32'.".format(isoch_dtype))
+
+        # Check size of the cache for lazy loaded isochrones.
+        if g.il_params[0] and g.il_params[1] < 0:
+            sys.exit("ERROR: the maximum number of isochrones stored when "
+                     "they\nare lazy loaded can not be negative; {} is set."
+                     .format(g.il_params[1]))
+
+        # Check the sizes of the caches of isochrones.
+        if min(g.ic_params) < 0:
+            sys.exit("ERROR: the maximum number of isochrones stored in the\n"
+                     "caches can not be negative; {}, {} are set.".format(
+                         *g.ic_params))
+
         # Check IMF defined.
         imfs_dict = {'chabrier_2001_exp', 'chabrier_2001_log', 'kroupa_1993',
                      'kroupa_2002'}
@@ -363,10 +453,26 @@ def check(mypath, file_end, cl_files):
                 sys.exit("ERROR: Binarity fraction value '{}' is out of\n"
                          "boundaries. Please select a value in the range "
                          "[0., 1.]".format(bin_fr_val))
-        if g.sc_params[-1] > 1.:
+        if g.sc_params[2] > 1.:
             sys.exit("ERROR: Binary mass ratio set ('{}') is out of\n"
                      "boundaries. Please select a value in the range [0., 1.]".
-                     format(g.sc_params[-1]))
+                     format(g.sc_params[2]))
+
+        # Check distribution of mass ratios for binary systems.
+        if g.sc_params[4] not in {'uniform', 'powerlaw'}:
+            sys.exit("ERROR: Distribution of binary mass ratios ('{}') is\n"
+                     "not valid.".format(g.sc_params[4]))
+        if g.sc_params[4] == 'powerlaw' and g.sc_params[2] <= 0. and \
+                g.sc_params[5] <= -1.:
+            sys.exit("ERROR: the power-law distribution of binary mass\n"
+                     "ratios requires gamma > -1 if the minimum mass ratio\n"
+                     "is 0.")
+
+        # Check method to obtain the total number of stars.
+        if g.sc_params[3] not in {'round', 'poisson'}:
+            sys.exit("ERROR: Method to obtain the number of stars in the\n"
+                     "synthetic clusters ('{}') is not valid.".format(
+                         g.sc_params[3]))
 
         # Check selected isochrones set.
         if iso_select not in {'PAR10', 'PAR11', 'PAR12'}:
@@ -153,7 +153,8 @@ def asteca_funcs(cl_file, ip_list, R_in_place):
     # synthetic cluster creation function.
     err_lst = sce(phot_data, err_pck)
     # Obtain best fitting parameters for cluster.
-    bf_return = bfsc(err_lst, red_return[0], completeness, ip_list)
+    bf_return = bfsc(clust_name, output_subdir, err_lst, red_return[0],
+                     completeness, ip_list)
 
     # Create output synthetic cluster file if one was found
     s_c_f(bf_return[3], synth_file_out)
@@ -31,7 +31,7 @@ def pl_bf_synth_cl(gs, x_min_cmd, x_max_cmd, y_min_cmd, y_max_cmd, x_ax, y_ax,
     ax.minorticks_on()
     ax.xaxis.set_major_locator(MultipleLocator(1.0))
     # Plot grid.
-    if g.bf_params[2] == 'dolphin':
+    if g.bf_params[2] in {'dolphin', 'mighell'}:
         for x_ed in syn_b_edges[0]:
             # vertical lines
             ax.axvline(x_ed, linestyle=':', color='k', zorder=1)
@@ -99,8 +99,11 @@ def pl_ga_lkl(gs, l_min_max, lkl_old, model_done, new_bs_indx):
     text2 = '$n_{gen}=%d\,;\,n_{pop}=%d$' '\n' % (n_gen, n_pop)
     text3 = '$f_{dif}=%0.2f\,;\,cr_{sel}=%s$' '\n' % (fdif, cr_sel)
     text4 = '$p_{cross}=%0.2f\,;\,p_{mut}=%0.2f$' '\n' % (p_cross, p_mut)
-    text5 = '$n_{el}=%d\,;\,n_{ei}=%d\,;\,n_{es}=%d$' % (n_el, n_ei, n_es)
-    text = text1 + text2 + text3 + text4 + text5
+    text5 = '$n_{el}=%d\,;\,n_{ei}=%d\,;\,n_{es}=%d$' '\n' % \
+        (n_el, n_ei, n_es)
+    # Reason why the GA stopped.
+    text6 = 'Exit: {}'.format(lkl_old[4])
+    text = text1 + text2 + text3 + text4 + text5 + text6
     ob = offsetbox.AnchoredText(text, loc=1, prop=dict(size=12))
     ob.patch.set(boxstyle='square,pad=0.', alpha=0.85)
     ax.add_artist(ob)